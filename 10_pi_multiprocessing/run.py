@@ -1,13 +1,284 @@
 import sys
+import os
 import logging
 import multiprocessing
-import Queue
+import threading
 import time
+import Queue
 
-from PySide import QtGui, QtCore
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import cancel, checkpoints, chunking, digits, dispatch, kernel, notify, protocol, results, scheduler, series, shm, trace, workers
 
 logging.basicConfig(level=logging.DEBUG)
 
+#: Number of worker processes.  Set it to 1 to have a single process do the
+#: whole series.
+WORKERS = multiprocessing.cpu_count()
+
+#: Most sub-ranges handed to the workers at once.  The rest wait in the
+#: scheduler, most urgent first.
+CONCURRENCY = WORKERS
+
+#: Number of worker threads, for jobs that aren't worth sending to the
+#: processes (see picalc.dispatch)
+THREADS = 1
+
+#: Seconds of work to aim every plain series sub-range at.  A job is cut
+#: into sub-ranges as it's handed out, sized from how fast the last ones
+#: went, so Stop, progress and the load on each worker stay even whatever
+#: the machine.
+CHUNK_TIME = chunking.TARGET
+
+#: Have workers post progress to a shared memory board instead of sending
+#: it through gl_out_queue.  The GUI reads the board every BOARD_INTERVAL ms
+#: while jobs are running.
+SHARED_PROGRESS = True
+BOARD_INTERVAL = 50
+
+#: Ranges a digits job's binary splitting is done in, within the one
+#: worker that gets the job
+DIGITS_PARTS = 16
+
+
+class PartitionedJob(object):
+    """
+    GUI-side bookkeeping for one job that has been split across workers.
+
+    Progress is tracked per sub-range, keyed by the sub-range's start.
+    Once every sub-range is done, the block sums are reduced all at once,
+    which gives the same pi no matter how many workers there were.  If any
+    sub-range was cancelled, that is the partial sum of the blocks that
+    did get done.
+
+    A plain series job can start from a checkpoint, ``base``, given as
+    (i, total, compensation).  The sub-ranges then only cover i onwards.
+    If it runs to the end, it leaves its own checkpoints in ``checkpoints``.
+
+    Sub-ranges can be cut in two with split() while they wait to be handed
+    out, so the GUI can size them as it goes.
+
+    A job run to get within a ``tolerance`` says so in its summary if its
+    error didn't get there.
+    """
+    def __init__(self, iterations, ranges, base=(0, 0.0, 0.0), checkpoints=None, tolerance=None):
+        self.iterations = iterations
+        self.ranges = dict(ranges)
+        self.base = base
+        self.checkpoints = checkpoints
+        self.tolerance = tolerance
+        self.progress = dict((start, (start, 0.0)) for start in self.ranges)
+        self.sums = {}
+        self.estimate = None
+        self.cancelled = False
+
+    def update(self, start, i, pi):
+        self.progress[start] = (i, pi)
+
+    def split(self, start, at):
+        """
+        Cut the sub-range beginning at start in two at ``at``.
+        """
+        self.ranges[at] = self.ranges[start]
+        self.ranges[start] = at
+        self.progress[at] = (at, 0.0)
+
+    def finish(self, start, i, sums, error=None):
+        """
+        Record a finished sub-range.  ``i`` is where it stopped, which is
+        short of the end of the sub-range if it was cancelled.  ``error`` is
+        the worker's error estimate, if it made one.
+        """
+        if i < self.ranges[start]:
+            self.cancelled = True
+        if error is not None:
+            self.estimate = error
+        self.progress[start] = (i, kernel.reduce_block_sums(sums))
+        self.sums[start] = sums
+        if self.finished() and not self.cancelled and self.checkpoints is not None:
+            total, compensation = self.base[1:]
+            starts = sorted(self.ranges)
+            for lo in starts:
+                total, compensation = self.checkpoints.extend(
+                    lo, self.ranges[lo], self.sums[lo], total, compensation, lo == starts[-1])
+
+    def finished(self):
+        return len(self.sums) == len(self.ranges)
+
+    def completed(self):
+        return self.base[0] + sum(i - start for start, (i, pi) in self.progress.iteritems())
+
+    def percent(self):
+        return (float(self.completed()) / float(self.iterations)) * 100.0
+
+    def error(self):
+        if self.estimate is not None:
+            return self.estimate
+        return series.error_bound(self.iterations)
+
+    def met(self):
+        """
+        Return False if the job has a tolerance and its error is more.
+        """
+        return self.tolerance is None or self.error() <= self.tolerance
+
+    def pi(self):
+        if self.finished():
+            return kernel.reduce_block_sums(
+                list(self.base[1:]) + [value for sums in self.sums.itervalues() for value in sums])
+        return sum(pi for i, pi in self.progress.itervalues()) + self.base[1] + self.base[2]
+
+    def status(self):
+        return "i={0} pi={1}".format(self.completed(), self.pi())
+
+    def summary(self):
+        if self.cancelled:
+            return "Cancelled at i={0} pi={1}".format(self.completed(), self.pi())
+        return "pi={0} +/- {1:.1e}{2}".format(self.pi(), self.error(), series.missed(self.error(), self.tolerance))
+
+
+class DigitsJob(object):
+    """
+    GUI-side bookkeeping for an arbitrary precision job.
+
+    The first half of the progress bar is the binary splitting, where the
+    progress messages carry (terms done, total terms) instead of (i, pi).
+    The second half is the digits as they stream in.
+    """
+    def __init__(self, digits):
+        self.digits = digits
+        self.terms = 1
+        self.terms_done = 0
+        self.received = 0
+        self.cancelled = False
+        self.done = False
+
+    def update(self, start, i, terms):
+        self.terms_done = i
+        self.terms = int(terms)
+
+    def add(self, text):
+        if not self.received:
+            text = text.split(".", 1)[1]
+        self.terms_done = self.terms
+        self.received += len(text)
+
+    def finish(self, start, i, sums, error=None):
+        self.cancelled = i < self.digits
+        self.done = True
+
+    def finished(self):
+        return self.done
+
+    def percent(self):
+        return (50.0 * self.terms_done / self.terms) + (50.0 * self.received / self.digits)
+
+    def status(self):
+        if self.received:
+            return "Got {0} of {1} digits".format(self.received, self.digits)
+        return "Summed {0} of {1} terms".format(self.terms_done, self.terms)
+
+    def summary(self):
+        if self.cancelled:
+            return "Cancelled after {0} of {1} digits".format(self.received, self.digits)
+        return "Got {0} digits of pi".format(self.digits)
+
+
+class GregoryLeibniz(object):
+    def __init__(self, exit_flag, cancelled_jobs, in_queue, out_queue, doorbell, board=None, slot=0):
+        super(GregoryLeibniz, self).__init__()
+        self.exit_flag = exit_flag
+        self.cancelled_jobs = cancelled_jobs
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.doorbell = doorbell
+        self.writer = protocol.Writer(out_queue, doorbell, exit_flag=exit_flag)
+        self.board = board
+        self.slot = slot
+
+    def run(self):
+        while self.exit_flag.is_set() == False:
+            job = self.in_queue.get()  # Sleeps until there's something to do
+            if job is workers.WAKEUP:
+                continue  # Go look at exit_flag
+            job_id, mode, start, stop = job
+            if mode == dispatch.PING:
+                self.writer.add(protocol.DONE, job_id)
+                self.writer.flush()
+                continue
+            try:
+                with trace.span("chunk", "kernel", job=job_id, start=start, stop=stop):
+                    if mode == digits.MODE:
+                        self.calculate_digits(job_id, stop)
+                        self.writer.add(protocol.DONE, job_id, start, stop)
+                    else:
+                        began = time.time()
+                        sums, error = self.calculate(job_id, mode, start, stop)
+                        # The GUI sizes the plain series sub-ranges by how long they take
+                        elapsed = time.time() - began if mode == series.PLAIN else 0.0
+                        self.writer.add(protocol.DONE, job_id, start, stop, elapsed, error, sums)
+            except kernel.Cancelled as e:
+                sums = e.sums if e.sums is not None else [e.pi]
+                self.writer.add(protocol.CANCELLED, job_id, start, e.i, payload=sums)
+            self.writer.flush()
+            trace.flush()
+            # self.in_queue.task_done()  # task_done not in multiprocessing.Queue
+
+    def calculate(self, job_id, mode, start, stop):
+        """
+        Sum terms start..stop-1 and return (sums, error).
+
+        For the plain series, sums is the list of block sums, so the GUI
+        can reduce every worker's blocks together, and error is None.  The
+        other modes always get the whole range, so sums is just [pi], along
+        with the mode's own error estimate.  Progress waits in the Writer
+        for the next batch, and the done or cancelled record replaces it.
+        """
+        if self.board is not None:
+            # Posting to the board is a handful of stores, so there's no
+            # need to throttle it.
+            def reporter(i, pi):
+                self.board.post(self.slot, job_id, start, i, pi)
+        else:
+            def reporter(i, pi):
+                self.writer.add(protocol.PROGRESS, job_id, start, i, pi)
+                self.writer.flush_due()
+        token = cancel.Token(self.cancelled_jobs, job_id)
+        if mode == series.PLAIN:
+            return kernel.block_sums(stop, start, progress=reporter, cancel=token), None
+        pi, error = series.evaluate(mode, stop, reporter, token)
+        return [pi], error
+
+    def calculate_digits(self, job_id, count):
+        """
+        Work out ``count`` digits of pi, right here in this worker, and
+        stream them back a chunk at a time as DIGITS records.  The binary
+        splitting goes a DIGITS_PARTS range at a time, for the progress and
+        the cancel checks.
+        """
+        def progress(i, terms):
+            self.writer.add(protocol.PROGRESS, job_id, 0, i, terms)
+            self.writer.flush_due()
+        for text in digits.pi_digits(count, DIGITS_PARTS, progress,
+                                     cancel.Token(self.cancelled_jobs, job_id)):
+            self.writer.add(protocol.DIGITS, job_id, payload=text)
+            self.writer.flush_due()
+
+
+def gl_process(exit_flag, cancelled_jobs, in_queue, out_queue, doorbell, board=None, slot=0):
+    process = GregoryLeibniz(exit_flag, cancelled_jobs, in_queue, out_queue, doorbell, board, slot)
+    process.run()
+
+
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    # Everything the headless mode needs is above, so Qt is never imported
+    from picalc import headless
+    sys.exit(headless.main(sys.modules[__name__], sys.argv[1:]))
+
+from PySide import QtGui, QtCore
+
+from picalc import plot, watchdog
+
+
 class MainWindow(QtGui.QMainWindow):
     #: Use this signal to update the status bar message
     updateStatusBar = QtCore.Signal(str)
@@ -24,6 +295,21 @@ class MainWindow(QtGui.QMainWindow):
         start_action.setShortcut("Ctrl+S")
         start_action.triggered.connect(self.on_start_click)
 
+        urgent_action = file_menu.addAction("Start &urgent")
+        urgent_action.setShortcut("Ctrl+U")
+        urgent_action.triggered.connect(self.on_urgent_click)
+
+        terms_action = file_menu.addAction("Start &terms...")
+        terms_action.setShortcut("Ctrl+N")
+        terms_action.triggered.connect(self.on_terms_click)
+
+        accuracy_action = file_menu.addAction("Start to &accuracy...")
+        accuracy_action.triggered.connect(self.on_accuracy_click)
+
+        digits_action = file_menu.addAction("Start &digits...")
+        digits_action.setShortcut("Ctrl+D")
+        digits_action.triggered.connect(self.on_digits_click)
+
         stop_action = file_menu.addAction("S&top")
         stop_action.setShortcut("Ctrl+T")
         stop_action.triggered.connect(self.on_stop_click)
@@ -33,11 +319,37 @@ class MainWindow(QtGui.QMainWindow):
         exit_action.setShortcut(QtGui.QKeySequence.Quit)
         exit_action.triggered.connect(self.close)
 
+        self.mode = series.PLAIN
+        series_menu = self.menuBar().addMenu("&Series")
+        series_group = QtGui.QActionGroup(self)
+        for mode in series.MODES:
+            action = series_menu.addAction(series.NAMES[mode])
+            action.setCheckable(True)
+            action.setChecked(mode == self.mode)
+            action.setData(mode)
+            series_group.addAction(action)
+        series_group.triggered.connect(self.on_series_select)
+
+        self.backend = dispatch.AUTO
+        backend_menu = self.menuBar().addMenu("&Backend")
+        backend_group = QtGui.QActionGroup(self)
+        for backend in dispatch.BACKENDS:
+            action = backend_menu.addAction(dispatch.NAMES[backend])
+            action.setCheckable(True)
+            action.setChecked(backend == self.backend)
+            action.setData(backend)
+            backend_group.addAction(action)
+        backend_group.triggered.connect(self.on_backend_select)
+
         help_menu = self.menuBar().addMenu("&Help")
         help_action = help_menu.addAction("&Help")
         help_action.setShortcut(QtGui.QKeySequence.HelpContents)
         help_action.triggered.connect(self.on_help)
 
+        trace_action = help_menu.addAction("Record &trace")
+        trace_action.setCheckable(True)
+        trace_action.toggled.connect(self.on_trace_toggle)
+
         centralWidget = QtGui.QWidget(self)
 
         # Create 3 buttons
@@ -55,6 +367,8 @@ class MainWindow(QtGui.QMainWindow):
         self.progress_bar = QtGui.QProgressBar(self)
         # Using self here because I need to reference this in a slot
 
+        self.plot = plot.ConvergencePlot(self)
+
         # Lay them out horizontally
         button_container = QtGui.QWidget(self)
         button_layout = QtGui.QHBoxLayout(button_container)
@@ -66,6 +380,11 @@ class MainWindow(QtGui.QMainWindow):
         centralLayout = QtGui.QVBoxLayout(centralWidget)
         centralLayout.addWidget(button_container)
         centralLayout.addWidget(self.progress_bar)
+        centralLayout.addWidget(self.plot)
+
+        self.digits_view = QtGui.QPlainTextEdit(self)
+        self.digits_view.setReadOnly(True)
+        centralLayout.addWidget(self.digits_view)
         centralWidget.setLayout(centralLayout)
 
         self.setCentralWidget(centralWidget)
@@ -78,23 +397,207 @@ class MainWindow(QtGui.QMainWindow):
 
         self.exit_flag = multiprocessing.Event()
         self.gl_in_queue = multiprocessing.Queue()
-        self.gl_out_queue = multiprocessing.Queue()
-        self.gregory_leibniz = multiprocessing.Process(target=gl_process, args=(self.exit_flag, self.gl_in_queue, self.gl_out_queue))
-        self.gregory_leibniz.start()
-
-        self.queue_timer = QtCore.QTimer(self)
-        self.queue_timer.timeout.connect(self.check_gl_out_queue)
-        self.queue_timer.start(100)  # Check queue every 100 ms
+        self.gl_doorbell = notify.Doorbell()
+        self.gl_out_queue = multiprocessing.Queue(protocol.QUEUE_SIZE)
+        self.cancelled_jobs = multiprocessing.Value("l", -1)
+        self.gl_jobs = {}
+        self.gl_next_job = 0
+        self.gl_scheduler = scheduler.Scheduler(CONCURRENCY)
+        self.gl_sizer = chunking.ChunkSizer(CHUNK_TIME)
+        self.gl_checkpoints = checkpoints.CheckpointCache()
+        self.gl_results = results.ResultStore()
+        self.gl_started = {}  # job_id -> (mode, iterations, start time)
+        self.gl_display = None  # (percent, message) for update_display()
+        self.gl_board = shm.ProgressBoard(WORKERS) if SHARED_PROGRESS else None
+        self.gregory_leibniz = []
+        for n in xrange(WORKERS):
+            process = multiprocessing.Process(target=gl_process, args=(self.exit_flag, self.cancelled_jobs, self.gl_in_queue, self.gl_out_queue, self.gl_doorbell, self.gl_board, n))
+            process.start()
+            self.gregory_leibniz.append(process)
+        # The threads share gl_out_queue, and are started after the processes
+        # so that none of them gets forked
+        self.gl_thread_queue = Queue.Queue()
+        self.gl_thread_scheduler = scheduler.Scheduler(THREADS)
+        self.gl_threads = []
+        for n in xrange(THREADS):
+            thread = threading.Thread(target=gl_process, args=(self.exit_flag, self.cancelled_jobs, self.gl_thread_queue, self.gl_out_queue, self.gl_doorbell))
+            thread.start()
+            self.gl_threads.append(thread)
+        self.gl_backends = {}  # job_id -> THREAD or PROCESS, for the jobs out there
+        self.gl_pings = {}  # job_id -> (backend, time sent)
+        self.dispatcher = dispatch.Dispatcher(WORKERS)
+        self.dispatcher.calibrate()
+
+        self.gl_notifier = QtCore.QSocketNotifier(self.gl_doorbell.fileno(), QtCore.QSocketNotifier.Read, self)
+        self.gl_notifier.activated.connect(self.check_gl_out_queue)
+        # check_gl_out_queue only runs once a worker has rung the doorbell
+
+        self.board_timer = QtCore.QTimer(self)
+        self.board_timer.timeout.connect(self.check_gl_board)
+
+        self.watchdog = watchdog.Watchdog(self)
+        self.watchdog.start(paused=True)  # Only watched while jobs run
+
+        self.ping_gl_workers()
 
     @QtCore.Slot()
     def on_start_click(self):
-        self.gl_in_queue.put(5)
+        self.start_job(scheduler.NORMAL)
+
+    @QtCore.Slot()
+    def on_urgent_click(self):
+        self.start_job(scheduler.URGENT)
+
+    @QtCore.Slot()
+    def on_terms_click(self):
+        # The accelerated modes never use more than MAX_ACCELERATED terms
+        most = 2 ** 31 - 1 if self.mode in (series.PLAIN, series.PAIRS) else series.MAX_ACCELERATED
+        count, ok = QtGui.QInputDialog.getInt(self, "Terms", "How many terms?",
+                                              min(series.TERMS[self.mode], most), 1, most)
+        if ok:
+            self.start_job(scheduler.NORMAL, count)
+
+    @QtCore.Slot()
+    def on_accuracy_click(self):
+        places, ok = QtGui.QInputDialog.getInt(self, "Accuracy", "How many decimal places?",
+                                               8, 1, 15)
+        if ok:
+            # As many terms as the series needs for that, and no more
+            tolerance = series.tolerance_for(places)
+            self.start_job(scheduler.NORMAL, series.terms_for(self.mode, tolerance), tolerance)
+
+    def start_job(self, priority, iterations=None, tolerance=None):
+        job_id = self.gl_next_job
+        self.gl_next_job += 1
+        if iterations is None:
+            iterations = series.TERMS[self.mode]
+        stored = self.gl_results.lookup(self.mode, iterations)
+        if stored is not None:
+            self.progress_bar.setValue(100)
+            self.updateStatusBar.emit("pi={0} +/- {1:.1e}{2} (job {3}, stored)".format(
+                stored[0], stored[1], series.missed(stored[1], tolerance), job_id))
+            return
+        if self.mode == series.PLAIN:
+            # The workers only get the terms past the nearest checkpoint, and
+            # dispatch_gl_tasks cuts those up as it hands them out
+            base = self.gl_checkpoints.lookup(iterations)
+            ranges = [(base[0], iterations)] if base[0] < iterations else []
+            job = PartitionedJob(iterations, ranges, base, self.gl_checkpoints, tolerance)
+        else:
+            ranges = [(0, iterations)]  # Only the plain series gets split up
+            job = PartitionedJob(iterations, ranges, tolerance=tolerance)
+        if job.finished():
+            self.progress_bar.setValue(100)
+            self.updateStatusBar.emit("{0} (job {1})".format(job.summary(), job_id))
+            return
+        backend = self.backend
+        if backend == dispatch.AUTO:
+            backend = self.dispatcher.choose(self.mode, sum(stop - start for start, stop in ranges))
+        self.plot.start(job_id, iterations)
+        if backend == dispatch.INLINE:
+            self.run_inline(job_id, job, self.mode)
+            return
+        self.gl_jobs[job_id] = job
+        self.gl_started[job_id] = (self.mode, iterations, time.time())
+        self.gl_backends[job_id] = backend
+        tasks = [(job_id, self.mode, start, stop) for start, stop in ranges]
+        if backend == dispatch.THREAD:
+            self.gl_thread_scheduler.submit(job_id, priority, tasks)
+        else:
+            self.gl_scheduler.submit(job_id, priority, tasks)
+        trace.begin("job", job_id, mode=self.mode, backend=backend)
+        self.watchdog.resume()
+        self.dispatch_gl_tasks()
+        if self.gl_board is not None and not self.board_timer.isActive():
+            self.board_timer.start(BOARD_INTERVAL)
+
+    @QtCore.Slot()
+    def on_digits_click(self):
+        count, ok = QtGui.QInputDialog.getInt(self, "Digits", "How many digits of pi?",
+                                              100000, 1, 100000000)
+        if not ok:
+            return
+        job_id = self.gl_next_job
+        self.gl_next_job += 1
+        self.gl_jobs[job_id] = DigitsJob(count)
+        self.digits_view.clear()
+        self.gl_scheduler.submit(job_id, scheduler.NORMAL, [(job_id, digits.MODE, 0, count)])
+        trace.begin("job", job_id, mode=digits.MODE)
+        self.watchdog.resume()
+        self.dispatch_gl_tasks()
+
+    def run_inline(self, job_id, job, mode):
+        """
+        Work a small job out right here, the same way the workers would.
+        """
+        started = time.time()
+        for start, stop in sorted(job.ranges.items()):
+            if mode == series.PLAIN:
+                job.finish(start, stop, kernel.block_sums(stop, start))
+            else:
+                pi, error = series.evaluate(mode, stop)
+                job.finish(start, stop, [pi], error)
+        elapsed = time.time() - started
+        if mode == series.PLAIN:
+            self.dispatcher.record_rate(job.iterations - job.base[0], elapsed)
+        self.gl_results.record(mode, job.iterations, job.pi(), job.error(), elapsed)
+        self.plot.add(job.iterations, job.pi())
+        self.progress_bar.setValue(100)
+        self.updateStatusBar.emit("{0} (job {1}, inline)".format(job.summary(), job_id))
+
+    def ping_gl_workers(self):
+        """
+        Time a round trip to each backend, for the dispatcher.
+        """
+        for backend, queue in ((dispatch.THREAD, self.gl_thread_queue),
+                               (dispatch.PROCESS, self.gl_in_queue)):
+            job_id = self.gl_next_job
+            self.gl_next_job += 1
+            self.gl_pings[job_id] = (backend, time.time())
+            queue.put((job_id, dispatch.PING, 0, 0))
+
+    def dispatch_gl_tasks(self):
+        for task in self.gl_scheduler.ready(self.cut_gl_task):
+            with trace.span("queue put", "queue"):
+                self.gl_in_queue.put(task)
+        for task in self.gl_thread_scheduler.ready():
+            with trace.span("queue put", "queue"):
+                self.gl_thread_queue.put(task)
+
+    def cut_gl_task(self, task):
+        """
+        Split off the next sub-range of a plain series task, sized to take
+        about CHUNK_TIME.
+        """
+        job_id, mode, start, stop = task
+        if mode != series.PLAIN:
+            return task, None
+        cut = self.gl_sizer.cut(start, stop)
+        if cut >= stop:
+            return task, None
+        self.gl_jobs[job_id].split(start, cut)
+        return (job_id, mode, start, cut), (job_id, mode, cut, stop)
 
     @QtCore.Slot()
     def on_stop_click(self):
+        self.cancelled_jobs.value = self.gl_next_job - 1
         self.updateStatusBar.emit("Stop clicked")
+        # Tasks that never got to a worker are cancelled right here
+        for queued in (self.gl_scheduler, self.gl_thread_scheduler):
+            for job_id, (_, mode, start, stop) in queued.cancel(self.cancelled_jobs.value):
+                self.finish_gl_task(job_id, start, start, [], None)
+        self.update_display()
+
+    @QtCore.Slot(QtGui.QAction)
+    def on_series_select(self, action):
+        self.mode = action.data()
+
+    @QtCore.Slot(QtGui.QAction)
+    def on_backend_select(self, action):
+        self.backend = action.data()
 
     @QtCore.Slot(str)
+    @trace.traced("update_status_bar")
     def update_status_bar(self, message):
         self.statusBar().showMessage(message)
 
@@ -102,11 +605,28 @@ class MainWindow(QtGui.QMainWindow):
     def on_help(self):
         QtGui.QMessageBox.information(self,
                 "Help",
-                "Press Start to start processing.  Press Stop to stop "
-                "processing.  Press Quit to exit the program.",
+                "Press Start to start processing.  Start urgent jumps the "
+                "queue of waiting jobs.  Press Stop to stop "
+                "processing.  Press Quit to exit the program.\n\n"
+                "Jobs run inline, on a thread or on the worker processes, "
+                "depending on their size, unless the Backend menu says "
+                "otherwise.  Inline jobs can't be stopped.",
                 QtGui.QMessageBox.Ok,
                 QtGui.QMessageBox.Ok)
 
+    @QtCore.Slot(bool)
+    def on_trace_toggle(self, checked):
+        if checked:
+            trace.start()
+            self.updateStatusBar.emit("Recording a trace")
+            return
+        trace.stop()
+        path, _ = QtGui.QFileDialog.getSaveFileName(self, "Save trace", "picalc-trace.json",
+                                                    "Chrome traces (*.json)")
+        if path:
+            count = trace.save(path)
+            self.updateStatusBar.emit("Saved {0} trace events to {1}".format(count, path))
+
     @QtCore.Slot(float, str)
     def on_gl_progress(self, value, message):
         self.progress_bar.setValue(value)
@@ -118,61 +638,115 @@ class MainWindow(QtGui.QMainWindow):
         self.updateStatusBar.emit("pi={}".format(value))
 
     @QtCore.Slot()
+    @trace.traced("check_gl_out_queue")
     def check_gl_out_queue(self):
-        while True:
-            message = None
-            try:
-                message = self.gl_out_queue.get_nowait()
-            except Queue.Empty:
-                return  # No more messages.  Exit.
-            if message[0] == "progress":
-                self.progress_bar.setValue(message[1])
-            elif message[0] == "status":
-                self.updateStatusBar.emit(message[1])
-            elif message[0] == "done":
-                self.progress_bar.setValue(100)
-                self.updateStatusBar.emit("pi={}".format(message[1]))
+        updated = None
+        digits_text = []
+        for batch in notify.drain(self.gl_out_queue, self.gl_doorbell.answer()):
+            for record in protocol.unpack(batch):
+                if record.job_id in self.gl_pings:
+                    backend, sent = self.gl_pings.pop(record.job_id)
+                    self.dispatcher.record_latency(backend, time.time() - sent)
+                    continue
+                job = self.gl_jobs[record.job_id]
+                if record.kind == protocol.PROGRESS:
+                    job.update(record.start, record.i, record.value)
+                    if record.job_id == self.plot.job_id:
+                        self.plot.add(job.completed(), job.pi())
+                    updated = job
+                elif record.kind == protocol.DIGITS:
+                    job.add(record.payload)
+                    updated = job
+                    digits_text.append(record.payload)
+                else:
+                    updated = None
+                    threaded = self.gl_backends.get(record.job_id) == dispatch.THREAD
+                    if threaded:
+                        self.gl_thread_scheduler.task_done()
+                    else:
+                        self.gl_scheduler.task_done()
+                    if record.kind == protocol.DONE and record.value:
+                        self.dispatcher.record_rate(record.i - record.start, record.value)
+                        if not threaded:
+                            self.gl_sizer.record(chunking.blocks_in(record.start, record.i), record.value)
+                    self.finish_gl_task(record.job_id, record.start, record.i, record.payload, record.error)
             # self.gl_out_queue.task_done()  # task_done not in multiprocessing.Queue
+        if digits_text:
+            text = "".join(digits_text)
+            self.digits_view.appendPlainText(
+                "\n".join(text[k:k + 100] for k in xrange(0, len(text), 100)))
+        if updated is not None:
+            # Only the latest progress gets formatted and shown
+            self.show_status(updated.percent(), updated.status())
+        self.update_display()
+        self.dispatch_gl_tasks()
+
+    def show_status(self, percent, message):
+        """
+        Have the progress bar and status bar show these once the records
+        in hand have all been dealt with.  Whatever comes last wins, so a
+        drain repaints them at most once.  ``percent`` can be None to leave
+        the progress bar alone.
+        """
+        self.gl_display = (percent, message)
+
+    def update_display(self):
+        if self.gl_display is not None:
+            percent, message = self.gl_display
+            self.gl_display = None
+            if percent is not None:
+                self.progress_bar.setValue(percent)
+            self.updateStatusBar.emit(message)
+
+    def finish_gl_task(self, job_id, start, i, sums, error):
+        job = self.gl_jobs[job_id]
+        job.finish(start, i, sums, error)
+        if job.finished():
+            trace.end("job", job_id, cancelled=job.cancelled)
+            del self.gl_jobs[job_id]
+            self.gl_backends.pop(job_id, None)
+            started = self.gl_started.pop(job_id, None)
+            if not job.cancelled:
+                if job_id == self.plot.job_id:
+                    self.plot.add(job.iterations, job.pi())
+                if started is not None:
+                    mode, iterations, started = started
+                    self.gl_results.record(mode, iterations, job.pi(), job.error(), time.time() - started)
+            self.show_status(None if job.cancelled else 100, "{0} (job {1})".format(job.summary(), job_id))
+            if not self.gl_jobs:
+                self.board_timer.stop()
+                self.watchdog.pause()
+                self.ping_gl_workers()  # While nothing else is holding them up
 
-    def closeEvent(self, event):
-        self.exit_flag.set()
-        self.gregory_leibniz.join()
-
-
-class GregoryLeibniz(object):
-    def __init__(self, exit_flag, in_queue, out_queue):
-        super(GregoryLeibniz, self).__init__()
-        self.exit_flag = exit_flag
-        self.in_queue = in_queue
-        self.out_queue = out_queue
-
-    def run(self):
-        while self.exit_flag.is_set() == False:
-            iterations = None
-            try:
-                iterations = self.in_queue.get_nowait()
-            except Queue.Empty:
-                continue
-            self.out_queue.put(("done", self.calculate(iterations)))
-            # self.in_queue.task_done()  # task_done not in multiprocessing.Queue
-
-    def calculate(self, iterations):
-        "%s %.8f" % ("hi", 1)
-        pi = 0.0
-        for i in xrange(iterations):
-            if i % 2 == 0:
-                pi += 4.0 / (2.0 * i + 1.0)
-            else:
-                pi -= 4.0 / (2.0 * i + 1.0)
-            self.out_queue.put(("progress", (float(i) / float(iterations)) * 100.0))
-            self.out_queue.put(("status", "i={0} pi={1}".format(i, pi)))
-            time.sleep(1)
-        return pi
-
+    @QtCore.Slot()
+    @trace.traced("check_gl_board")
+    def check_gl_board(self):
+        updated = None
+        for slot in xrange(len(self.gl_board)):
+            job_id, start, i, pi = self.gl_board.read(slot)
+            job = self.gl_jobs.get(job_id)
+            # A slot can still hold a sub-range that has since finished, and
+            # the done message's sums are better than the last progress.
+            if isinstance(job, PartitionedJob) and start not in job.sums:
+                job.update(start, i, pi)
+                updated = job
+                if job_id == self.plot.job_id:
+                    self.plot.add(job.completed(), job.pi())
+        if updated is not None:
+            self.progress_bar.setValue(updated.percent())
+            self.updateStatusBar.emit(updated.status())
 
-def gl_process(exit_flag, in_queue, out_queue):
-    process = GregoryLeibniz(exit_flag, in_queue, out_queue)
-    process.run()
+    def closeEvent(self, event):
+        self.cancelled_jobs.value = self.gl_next_job - 1
+        elapsed = workers.shutdown(self.exit_flag, self.gl_in_queue, self.gregory_leibniz)
+        elapsed += workers.shutdown(self.exit_flag, self.gl_thread_queue, self.gl_threads)
+        logging.debug("Workers shut down in %.1f ms", elapsed * 1000.0)
+        self.gl_notifier.setEnabled(False)
+        self.gl_doorbell.close()
+        self.gl_results.close()
+        self.board_timer.stop()
+        self.watchdog.stop()
+        logging.debug(self.watchdog.report())
 
 
 if __name__ == "__main__":
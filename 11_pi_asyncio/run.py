@@ -0,0 +1,236 @@
+import sys
+import os
+import logging
+import asyncio
+import concurrent.futures
+import multiprocessing
+
+from PySide2 import QtGui, QtCore, QtWidgets
+from qasync import QEventLoop
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import kernel, series, watchdog
+
+logging.basicConfig(level=logging.DEBUG)
+
+#: Number of workers in the executor pool
+WORKERS = multiprocessing.cpu_count()
+
+#: Run the chunks in a pool of processes.  Set it to False to use a pool of
+#: threads; NumPy lets go of the GIL while it sums a block.
+PROCESSES = True
+
+#: Kernel blocks per chunk.  Every chunk is one call on the executor, and
+#: the progress bar moves on each time one comes back.
+CHUNK_BLOCKS = 64
+
+
+def install_event_loop(app):
+    """
+    Make a qasync event loop, which runs asyncio on top of Qt's event
+    loop, the current asyncio loop.  It only dispatches asyncio callbacks
+    inside its run_forever() (or run_until_complete()), not under a bare
+    app.exec_(), so that's what has to drive the window.
+    """
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+class MainWindow(QtWidgets.QMainWindow):
+    #: Use this signal to update the status bar message
+    updateStatusBar = QtCore.Signal(str)
+
+    def __init__(self):
+        """
+        Initialize the main window
+        """
+        super(MainWindow, self).__init__()
+        self.setWindowTitle("2: MainWindow")
+
+        file_menu = self.menuBar().addMenu("&File")
+        start_action = file_menu.addAction("&Start")
+        start_action.setShortcut("Ctrl+S")
+        start_action.triggered.connect(self.on_start_click)
+
+        stop_action = file_menu.addAction("S&top")
+        stop_action.setShortcut("Ctrl+T")
+        stop_action.triggered.connect(self.on_stop_click)
+
+        file_menu.addSeparator()
+        exit_action = file_menu.addAction("&Quit")
+        exit_action.setShortcut(QtGui.QKeySequence.Quit)
+        exit_action.triggered.connect(self.close)
+
+        self.mode = series.PLAIN
+        series_menu = self.menuBar().addMenu("&Series")
+        series_group = QtWidgets.QActionGroup(self)
+        for mode in series.MODES:
+            action = series_menu.addAction(series.NAMES[mode])
+            action.setCheckable(True)
+            action.setChecked(mode == self.mode)
+            action.setData(mode)
+            series_group.addAction(action)
+        series_group.triggered.connect(self.on_series_select)
+
+        help_menu = self.menuBar().addMenu("&Help")
+        help_action = help_menu.addAction("&Help")
+        help_action.setShortcut(QtGui.QKeySequence.HelpContents)
+        help_action.triggered.connect(self.on_help)
+
+        centralWidget = QtWidgets.QWidget(self)
+
+        # Create 3 buttons
+        start_button = QtWidgets.QPushButton("Start", self)
+        start_button.clicked.connect(self.on_start_click)
+
+        stop_button = QtWidgets.QPushButton("Stop", self)
+        stop_button.clicked.connect(self.on_stop_click)
+
+        quit_button = QtWidgets.QPushButton("Quit", self)
+        quit_button.clicked.connect(self.close)
+        # Clicked signal causes close signal to be emitted, which is handled
+        # by self.closeEvent slot.
+
+        self.progress_bar = QtWidgets.QProgressBar(self)
+        # Using self here because I need to reference this in a slot
+
+        # Lay them out horizontally
+        button_container = QtWidgets.QWidget(self)
+        button_layout = QtWidgets.QHBoxLayout(button_container)
+        button_layout.addWidget(start_button)
+        button_layout.addWidget(stop_button)
+        button_layout.addWidget(quit_button)
+        button_container.setLayout(button_layout)
+
+        centralLayout = QtWidgets.QVBoxLayout(centralWidget)
+        centralLayout.addWidget(button_container)
+        centralLayout.addWidget(self.progress_bar)
+        centralWidget.setLayout(centralLayout)
+
+        self.setCentralWidget(centralWidget)
+
+        self.statusBar().show()
+        # Show the status bar to keep the window from moving stuff around
+        # when the statusBar is shown the first time.
+
+        self.updateStatusBar.connect(self.update_status_bar)
+
+        if PROCESSES:
+            self.executor = concurrent.futures.ProcessPoolExecutor(WORKERS)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(WORKERS)
+        self.gl_tasks = set()  # One asyncio Task per running job
+        self.gl_chunks = set()  # concurrent.futures.Future for every chunk not done yet
+
+        self.watchdog = watchdog.Watchdog(self)
+        self.watchdog.start(paused=True)  # Only watched while jobs run
+
+    @QtCore.Slot()
+    def on_start_click(self):
+        task = asyncio.ensure_future(self.gregory_leibniz(self.mode, series.TERMS[self.mode]))
+        self.gl_tasks.add(task)
+        task.add_done_callback(self.finish_gl_task)
+        self.watchdog.resume()
+
+    def finish_gl_task(self, task):
+        self.gl_tasks.discard(task)
+        if not self.gl_tasks:
+            self.watchdog.pause()
+
+    @QtCore.Slot()
+    def on_stop_click(self):
+        self.cancel_all()
+        self.updateStatusBar.emit("Stop clicked")
+
+    def cancel_all(self):
+        for task in self.gl_tasks:
+            task.cancel()
+        for future in list(self.gl_chunks):
+            future.cancel()  # Only works on chunks the executor hasn't started
+
+    @QtCore.Slot(QtWidgets.QAction)
+    def on_series_select(self, action):
+        self.mode = action.data()
+
+    @QtCore.Slot(str)
+    def update_status_bar(self, message):
+        self.statusBar().showMessage(message)
+
+    @QtCore.Slot()
+    def on_help(self):
+        QtWidgets.QMessageBox.information(self,
+                "Help",
+                "Press Start to start processing.  Press Stop to stop "
+                "processing.  Press Quit to exit the program.",
+                QtWidgets.QMessageBox.Ok,
+                QtWidgets.QMessageBox.Ok)
+
+    async def gregory_leibniz(self, mode, iterations):
+        """
+        Work out pi on the executor and show the result.  This runs on the
+        GUI thread, but only between awaits, so it never holds the event
+        loop up for longer than a status bar update.
+        """
+        if mode != series.PLAIN:
+            # The accelerated modes only need a few hundred terms
+            try:
+                pi, error = await self.run_in_executor(series.evaluate, mode, iterations)
+            except asyncio.CancelledError:
+                self.updateStatusBar.emit("Cancelled")
+                return
+            self.progress_bar.setValue(100)
+            self.updateStatusBar.emit("pi={0} +/- {1:.1e}".format(pi, error))
+            return
+
+        chunks = -(-iterations // (CHUNK_BLOCKS * kernel.BLOCK_SIZE))
+        pending = dict((self.run_in_executor(kernel.block_sums, stop, start), (start, stop))
+                       for start, stop in kernel.split_range(iterations, chunks))
+        sums = []
+        completed = 0
+        pi = 0.0
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    start, stop = pending.pop(future)
+                    chunk = future.result()
+                    sums.extend(chunk)
+                    completed += stop - start
+                    pi += kernel.reduce_block_sums(chunk)
+                self.progress_bar.setValue((float(completed) / float(iterations)) * 100.0)
+                self.updateStatusBar.emit("i={0} pi={1}".format(completed, pi))
+        except asyncio.CancelledError:
+            for future in pending:
+                future.cancel()
+            self.updateStatusBar.emit("Cancelled at i={0} pi={1}".format(completed, pi))
+            return
+        self.progress_bar.setValue(100)
+        self.updateStatusBar.emit("pi={0} +/- {1:.1e}".format(
+            kernel.reduce_block_sums(sums), series.error_bound(iterations)))
+
+    def run_in_executor(self, function, *args):
+        """
+        Same as loop.run_in_executor(self.executor, ...), except the
+        concurrent future is kept in gl_chunks, so that Stop and Quit can
+        cancel it straight away, without waiting for the event loop.
+        """
+        future = self.executor.submit(function, *args)
+        self.gl_chunks.add(future)
+        future.add_done_callback(self.gl_chunks.discard)
+        return asyncio.wrap_future(future)
+
+    def closeEvent(self, event):
+        self.cancel_all()
+        self.executor.shutdown()  # Waits for the chunks that had started
+        self.watchdog.stop()
+        logging.debug(self.watchdog.report())
+
+
+if __name__ == "__main__":
+    app = QtWidgets.QApplication(sys.argv)
+    loop = install_event_loop(app)
+    mainWindow = MainWindow()
+    mainWindow.show()
+    with loop:
+        loop.run_forever()  # This starts the Qt event loop, with asyncio on top
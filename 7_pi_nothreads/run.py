@@ -1,11 +1,24 @@
 import sys
+import os
 import logging
 import time
 
 from PySide import QtGui, QtCore
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import cancel, kernel, plot, series, throttle, trace, watchdog
+
 logging.basicConfig(level=logging.DEBUG)
 
+#: Run jobs a slice at a time from a zero-interval QTimer, going back to
+#: the event loop between slices, instead of calling processEvents() from
+#: inside the Start slot.  Neither needs threads or subprocesses.
+TIME_SLICED = True
+
+#: Longest a slice runs, in seconds.  A click waits at most this long, plus
+#: one block, before it's handled.
+SLICE_TIME = 0.008
+
 class MainWindow(QtGui.QMainWindow):
     #: Use this signal to update the status bar message
     updateStatusBar = QtCore.Signal(str)
@@ -22,6 +35,9 @@ class MainWindow(QtGui.QMainWindow):
         start_action.setShortcut("Ctrl+S")
         start_action.triggered.connect(self.on_start_click)
 
+        accuracy_action = file_menu.addAction("Start to &accuracy...")
+        accuracy_action.triggered.connect(self.on_accuracy_click)
+
         stop_action = file_menu.addAction("S&top")
         stop_action.setShortcut("Ctrl+T")
         stop_action.triggered.connect(self.on_stop_click)
@@ -31,11 +47,26 @@ class MainWindow(QtGui.QMainWindow):
         exit_action.setShortcut(QtGui.QKeySequence.Quit)
         exit_action.triggered.connect(self.close)
 
+        self.mode = series.PLAIN
+        series_menu = self.menuBar().addMenu("&Series")
+        series_group = QtGui.QActionGroup(self)
+        for mode in series.MODES:
+            action = series_menu.addAction(series.NAMES[mode])
+            action.setCheckable(True)
+            action.setChecked(mode == self.mode)
+            action.setData(mode)
+            series_group.addAction(action)
+        series_group.triggered.connect(self.on_series_select)
+
         help_menu = self.menuBar().addMenu("&Help")
         help_action = help_menu.addAction("&Help")
         help_action.setShortcut(QtGui.QKeySequence.HelpContents)
         help_action.triggered.connect(self.on_help)
 
+        trace_action = help_menu.addAction("Record &trace")
+        trace_action.setCheckable(True)
+        trace_action.toggled.connect(self.on_trace_toggle)
+
         centralWidget = QtGui.QWidget(self)
 
         # Create 3 buttons
@@ -53,6 +84,8 @@ class MainWindow(QtGui.QMainWindow):
         self.progress_bar = QtGui.QProgressBar(self)
         # Using self here because I need to reference this in a slot
 
+        self.plot = plot.ConvergencePlot(self)
+
         # Lay them out horizontally
         button_container = QtGui.QWidget(self)
         button_layout = QtGui.QHBoxLayout(button_container)
@@ -64,6 +97,7 @@ class MainWindow(QtGui.QMainWindow):
         centralLayout = QtGui.QVBoxLayout(centralWidget)
         centralLayout.addWidget(button_container)
         centralLayout.addWidget(self.progress_bar)
+        centralLayout.addWidget(self.plot)
         centralWidget.setLayout(centralLayout)
 
         self.setCentralWidget(centralWidget)
@@ -74,16 +108,68 @@ class MainWindow(QtGui.QMainWindow):
 
         self.updateStatusBar.connect(self.update_status_bar)
 
+        self.cancelled_jobs = cancel.Watermark()
+        self.next_job = 0
+
+        # Time-sliced jobs, newest last.  Only the newest one runs, like a
+        # Start click inside processEvents() would have it.
+        self.jobs = []
+        self.slice_timer = QtCore.QTimer(self)
+        self.slice_timer.setInterval(0)  # Whenever the event loop is idle
+        self.slice_timer.timeout.connect(self.on_slice)
+
+        self.watchdog = watchdog.Watchdog(self)
+        self.watchdog.start(paused=True)  # Only watched while a job runs
+        self.blocking = 0  # Jobs running in gregory_leibniz(), nested in each other
+
     @QtCore.Slot()
     def on_start_click(self):
-        pi = self.gregory_leibniz(5)
-        self.updateStatusBar.emit("pi={}".format(pi))
+        self.start_job(series.TERMS[self.mode])
+
+    @QtCore.Slot()
+    def on_accuracy_click(self):
+        places, ok = QtGui.QInputDialog.getInt(self, "Accuracy", "How many decimal places?",
+                                               8, 1, 15)
+        if ok:
+            # As many terms as the series needs for that, and no more
+            tolerance = series.tolerance_for(places)
+            self.start_job(series.terms_for(self.mode, tolerance), tolerance)
+
+    def start_job(self, iterations, tolerance=None):
+        job_id = self.next_job
+        self.next_job += 1
+        self.plot.start(job_id, iterations)
+        trace.begin("job", job_id, mode=self.mode)
+        self.watchdog.resume()
+        if TIME_SLICED:
+            self.start_sliced(job_id, self.mode, iterations, tolerance)
+            return
+        self.blocking += 1
+        try:
+            pi, error = self.gregory_leibniz(self.mode, iterations,
+                                             cancel.Token(self.cancelled_jobs, job_id))
+        except kernel.Cancelled as e:
+            trace.end("job", job_id, cancelled=True)
+            self.updateStatusBar.emit("Cancelled at i={0} pi={1}".format(e.i, e.pi))
+            return
+        finally:
+            self.blocking -= 1
+            if not self.blocking:
+                self.watchdog.pause()
+        trace.end("job", job_id)
+        self.updateStatusBar.emit("pi={0} +/- {1:.1e}{2}".format(pi, error, series.missed(error, tolerance)))
 
     @QtCore.Slot()
     def on_stop_click(self):
+        self.cancelled_jobs.value = self.next_job - 1
         self.updateStatusBar.emit("Stop clicked")
 
+    @QtCore.Slot(QtGui.QAction)
+    def on_series_select(self, action):
+        self.mode = action.data()
+
     @QtCore.Slot(str)
+    @trace.traced("update_status_bar")
     def update_status_bar(self, message):
         self.statusBar().showMessage(message)
 
@@ -92,23 +178,84 @@ class MainWindow(QtGui.QMainWindow):
         QtGui.QMessageBox.information(self,
                 "Help",
                 "Press Start to start processing.  Press Stop to stop "
-                "processing.  Press Quit to exit the program.",
+                "processing.  Press Quit to exit the program.\n\n"
+                "There are no threads: the work is done a few milliseconds "
+                "at a time in between handling clicks.",
                 QtGui.QMessageBox.Ok,
                 QtGui.QMessageBox.Ok)
 
-    def gregory_leibniz(self, iterations):
-        pi = 0.0
-        for i in xrange(iterations):
-            if i % 2 == 0:
-                pi += 4.0 / (2.0 * i + 1.0)
-            else:
-                pi -= 4.0 / (2.0 * i + 1.0)
+    @QtCore.Slot(bool)
+    def on_trace_toggle(self, checked):
+        if checked:
+            trace.start()
+            self.updateStatusBar.emit("Recording a trace")
+            return
+        trace.stop()
+        path, _ = QtGui.QFileDialog.getSaveFileName(self, "Save trace", "picalc-trace.json",
+                                                    "Chrome traces (*.json)")
+        if path:
+            count = trace.save(path)
+            self.updateStatusBar.emit("Saved {0} trace events to {1}".format(count, path))
+
+    def closeEvent(self, event):
+        self.cancelled_jobs.value = self.next_job - 1
+        self.slice_timer.stop()
+        self.watchdog.stop()
+        logging.debug(self.watchdog.report())
+
+    def gregory_leibniz(self, mode, iterations, token=None):
+        def report(i, pi):
             self.progress_bar.setValue((float(i) / float(iterations)) * 100.0)
             self.updateStatusBar.emit("i={0} pi={1}".format(i, pi))
-            time.sleep(1)
+        reporter = throttle.Throttle(report, iterations)
+        def progress(i, pi):
+            self.plot.add(i, pi)  # Every block; the plot keeps its own pace
+            reporter(i, pi)
+            # We're still inside the on_start_click slot, so nothing else
+            # (like a Stop click) gets handled unless we let it.
+            QtGui.QApplication.processEvents()
+        pi, error = series.evaluate(mode, iterations, progress, cancel=token)
+        reporter.flush()
         self.progress_bar.setValue(100)
-        return pi
+        return pi, error
 
+    def start_sliced(self, job_id, mode, iterations, tolerance=None):
+        def report(i, pi):
+            if iterations:  # steps() still has a last (i, pi) for no terms
+                self.progress_bar.setValue((float(i) / float(iterations)) * 100.0)
+            self.updateStatusBar.emit("i={0} pi={1}".format(i, pi))
+        steps = series.steps(mode, iterations, cancel.Token(self.cancelled_jobs, job_id))
+        self.jobs.append((job_id, steps, throttle.Throttle(report, iterations), tolerance))
+        self.slice_timer.start()
+
+    @QtCore.Slot()
+    @trace.traced("on_slice")
+    def on_slice(self):
+        """
+        Run the newest job for up to SLICE_TIME, then let the event loop
+        have a go.
+        """
+        job_id, steps, reporter, tolerance = self.jobs[-1]
+        deadline = time.time() + SLICE_TIME
+        try:
+            for i, pi, error in steps:
+                if job_id == self.plot.job_id:
+                    self.plot.add(i, pi)
+                reporter(i, pi)
+                if time.time() >= deadline:
+                    return
+        except kernel.Cancelled as e:
+            trace.end("job", job_id, cancelled=True)
+            self.updateStatusBar.emit("Cancelled at i={0} pi={1}".format(e.i, e.pi))
+        else:
+            trace.end("job", job_id)
+            reporter.flush()
+            self.progress_bar.setValue(100)
+            self.updateStatusBar.emit("pi={0} +/- {1:.1e}{2}".format(pi, error, series.missed(error, tolerance)))
+        self.jobs.pop()
+        if not self.jobs:
+            self.slice_timer.stop()
+            self.watchdog.pause()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,26 @@
 import sys
+import os
 import logging
 import time
 
 from PySide import QtGui, QtCore
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import cancel, checkpoints, chunking, kernel, plot, results, scheduler, series, throttle, trace, watchdog
+
 logging.basicConfig(level=logging.DEBUG)
 
+#: Number of worker threads, each with its own GregoryLeibniz
+WORKERS = QtCore.QThread.idealThreadCount()
+
+#: Most jobs handed to the workers at once.  The rest wait in the
+#: scheduler, most urgent first.
+CONCURRENCY = WORKERS
+
+#: Seconds of work between progress reports and cancel checks.  Each
+#: worker sizes its chunks of the plain series to take about this long.
+CHUNK_TIME = chunking.TARGET
+
 class MainWindow(QtGui.QMainWindow):
     #: Use this signal to update the status bar message
     updateStatusBar = QtCore.Signal(str)
@@ -22,6 +37,13 @@ class MainWindow(QtGui.QMainWindow):
         start_action.setShortcut("Ctrl+S")
         start_action.triggered.connect(self.on_start_click)
 
+        urgent_action = file_menu.addAction("Start &urgent")
+        urgent_action.setShortcut("Ctrl+U")
+        urgent_action.triggered.connect(self.on_urgent_click)
+
+        accuracy_action = file_menu.addAction("Start to &accuracy...")
+        accuracy_action.triggered.connect(self.on_accuracy_click)
+
         stop_action = file_menu.addAction("S&top")
         stop_action.setShortcut("Ctrl+T")
         stop_action.triggered.connect(self.on_stop_click)
@@ -31,11 +53,26 @@ class MainWindow(QtGui.QMainWindow):
         exit_action.setShortcut(QtGui.QKeySequence.Quit)
         exit_action.triggered.connect(self.close)
 
+        self.mode = series.PLAIN
+        series_menu = self.menuBar().addMenu("&Series")
+        series_group = QtGui.QActionGroup(self)
+        for mode in series.MODES:
+            action = series_menu.addAction(series.NAMES[mode])
+            action.setCheckable(True)
+            action.setChecked(mode == self.mode)
+            action.setData(mode)
+            series_group.addAction(action)
+        series_group.triggered.connect(self.on_series_select)
+
         help_menu = self.menuBar().addMenu("&Help")
         help_action = help_menu.addAction("&Help")
         help_action.setShortcut(QtGui.QKeySequence.HelpContents)
         help_action.triggered.connect(self.on_help)
 
+        trace_action = help_menu.addAction("Record &trace")
+        trace_action.setCheckable(True)
+        trace_action.toggled.connect(self.on_trace_toggle)
+
         centralWidget = QtGui.QWidget(self)
 
         # Create 3 buttons
@@ -53,6 +90,8 @@ class MainWindow(QtGui.QMainWindow):
         self.progress_bar = QtGui.QProgressBar(self)
         # Using self here because I need to reference this in a slot
 
+        self.plot = plot.ConvergencePlot(self)
+
         # Lay them out horizontally
         button_container = QtGui.QWidget(self)
         button_layout = QtGui.QHBoxLayout(button_container)
@@ -64,6 +103,7 @@ class MainWindow(QtGui.QMainWindow):
         centralLayout = QtGui.QVBoxLayout(centralWidget)
         centralLayout.addWidget(button_container)
         centralLayout.addWidget(self.progress_bar)
+        centralLayout.addWidget(self.plot)
         centralWidget.setLayout(centralLayout)
 
         self.setCentralWidget(centralWidget)
@@ -74,22 +114,94 @@ class MainWindow(QtGui.QMainWindow):
 
         self.updateStatusBar.connect(self.update_status_bar)
 
-        self.subthread = QtCore.QThread(self)
-        self.gregory_leibniz = GregoryLeibniz()
-        self.gregory_leibniz.progress.connect(self.on_gl_progress)
-        self.gregory_leibniz.done.connect(self.on_gl_done)
-        self.subthread.start()
-        self.gregory_leibniz.moveToThread(self.subthread)
+        self.cancelled_jobs = cancel.Watermark()
+        self.gl_next_job = 0
+        self.gl_scheduler = scheduler.Scheduler(CONCURRENCY)
+        self.gl_checkpoints = checkpoints.CheckpointCache()
+        self.gl_results = results.ResultStore()
+        self.gl_started = {}  # job_id -> (mode, iterations, start time)
+        self.gl_tolerances = {}  # job_id -> tolerance asked for, or None
+        self.subthreads = []
+        self.gregory_leibniz = []
+        for n in xrange(WORKERS):
+            subthread = QtCore.QThread(self)
+            worker = GregoryLeibniz(self.cancelled_jobs, self.gl_checkpoints)
+            worker.progress.connect(self.on_gl_progress)
+            worker.done.connect(self.on_gl_done)
+            worker.cancelled.connect(self.on_gl_cancelled)
+            subthread.start()
+            worker.moveToThread(subthread)
+            self.subthreads.append(subthread)
+            self.gregory_leibniz.append(worker)
+        self.gl_idle = list(self.gregory_leibniz)
+        self.gl_busy = {}  # job_id -> the worker running it
+
+        self.watchdog = watchdog.Watchdog(self)
+        self.watchdog.start(paused=True)  # Only watched while jobs run
 
     @QtCore.Slot()
     def on_start_click(self):
-        self.gregory_leibniz.start.emit(5)
+        self.start_job(scheduler.NORMAL)
+
+    @QtCore.Slot()
+    def on_urgent_click(self):
+        self.start_job(scheduler.URGENT)
+
+    @QtCore.Slot()
+    def on_accuracy_click(self):
+        places, ok = QtGui.QInputDialog.getInt(self, "Accuracy", "How many decimal places?",
+                                               8, 1, 15)
+        if ok:
+            # As many terms as the series needs for that, and no more
+            tolerance = series.tolerance_for(places)
+            self.start_job(scheduler.NORMAL, series.terms_for(self.mode, tolerance), tolerance)
+
+    def start_job(self, priority, iterations=None, tolerance=None):
+        job_id = self.gl_next_job
+        self.gl_next_job += 1
+        if iterations is None:
+            iterations = series.TERMS[self.mode]
+        stored = self.gl_results.lookup(self.mode, iterations)
+        if stored is not None:
+            self.progress_bar.setValue(100)
+            self.updateStatusBar.emit("pi={0} +/- {1:.1e}{2} (job {3}, stored)".format(
+                stored[0], stored[1], series.missed(stored[1], tolerance), job_id))
+            return
+        self.gl_tolerances[job_id] = tolerance
+        self.gl_scheduler.submit(job_id, priority, [(job_id, self.mode, iterations)])
+        trace.begin("job", job_id, mode=self.mode)
+        self.watchdog.resume()
+        self.dispatch_gl_jobs()
+
+    def dispatch_gl_jobs(self):
+        for job_id, mode, iterations in self.gl_scheduler.ready():
+            worker = self.gl_idle.pop()
+            self.gl_busy[job_id] = worker
+            self.gl_started[job_id] = (mode, iterations, time.time())
+            self.plot.start(job_id, iterations)
+            worker.start.emit(job_id, mode, float(iterations))
+
+    def release_gl_worker(self, job_id):
+        self.gl_idle.append(self.gl_busy.pop(job_id))
+        self.gl_scheduler.task_done()
+        self.dispatch_gl_jobs()
+        if not self.gl_busy:
+            self.watchdog.pause()
 
     @QtCore.Slot()
     def on_stop_click(self):
+        self.cancelled_jobs.value = self.gl_next_job - 1
         self.updateStatusBar.emit("Stop clicked")
+        # Jobs that never got to a worker are cancelled right here
+        for job_id, job in self.gl_scheduler.cancel(self.cancelled_jobs.value):
+            self.on_gl_cancelled(job_id, 0, 0.0)
+
+    @QtCore.Slot(QtGui.QAction)
+    def on_series_select(self, action):
+        self.mode = action.data()
 
     @QtCore.Slot(str)
+    @trace.traced("update_status_bar")
     def update_status_bar(self, message):
         self.statusBar().showMessage(message)
 
@@ -97,48 +209,104 @@ class MainWindow(QtGui.QMainWindow):
     def on_help(self):
         QtGui.QMessageBox.information(self,
                 "Help",
-                "Press Start to start processing.  Press Stop to stop "
+                "Press Start to start processing.  Start urgent jumps the "
+                "queue of waiting jobs.  Press Stop to stop "
                 "processing.  Press Quit to exit the program.",
                 QtGui.QMessageBox.Ok,
                 QtGui.QMessageBox.Ok)
 
-    @QtCore.Slot(float, str)
-    def on_gl_progress(self, value, message):
-        self.progress_bar.setValue(value)
-        self.updateStatusBar.emit(message)
-
-    @QtCore.Slot(str)
-    def on_gl_done(self, value):
+    @QtCore.Slot(bool)
+    def on_trace_toggle(self, checked):
+        if checked:
+            trace.start()
+            self.updateStatusBar.emit("Recording a trace")
+            return
+        trace.stop()
+        path, _ = QtGui.QFileDialog.getSaveFileName(self, "Save trace", "picalc-trace.json",
+                                                    "Chrome traces (*.json)")
+        if path:
+            count = trace.save(path)
+            self.updateStatusBar.emit("Saved {0} trace events to {1}".format(count, path))
+
+    @QtCore.Slot(int, float, float)
+    @trace.traced("on_gl_progress")
+    def on_gl_progress(self, job_id, i, pi):
+        # i comes as a float, because a Qt int stops at 2**31
+        if job_id == self.plot.job_id:
+            self.plot.add(i, pi)
+        mode, iterations, started = self.gl_started[job_id]
+        self.progress_bar.setValue((i / float(iterations)) * 100.0)
+        self.updateStatusBar.emit("i={0} pi={1}".format(int(i), pi))
+
+    @QtCore.Slot(int, float, float)
+    @trace.traced("on_gl_done")
+    def on_gl_done(self, job_id, value, error):
+        trace.end("job", job_id)
+        mode, iterations, started = self.gl_started.pop(job_id)
+        self.gl_results.record(mode, iterations, value, error, time.time() - started)
+        if job_id == self.plot.job_id:
+            self.plot.add(iterations, value)
+        self.release_gl_worker(job_id)
         self.progress_bar.setValue(100)
-        self.updateStatusBar.emit("pi={}".format(value))
+        self.updateStatusBar.emit("pi={0} +/- {1:.1e}{2} (job {3})".format(
+            value, error, series.missed(error, self.gl_tolerances.pop(job_id)), job_id))
+
+    @QtCore.Slot(int, float, float)
+    @trace.traced("on_gl_cancelled")
+    def on_gl_cancelled(self, job_id, i, pi):
+        trace.end("job", job_id, cancelled=True)
+        self.gl_tolerances.pop(job_id, None)
+        if job_id in self.gl_busy:
+            del self.gl_started[job_id]
+            self.release_gl_worker(job_id)
+        self.updateStatusBar.emit("Cancelled at i={0} pi={1} (job {2})".format(int(i), pi, job_id))
 
     def closeEvent(self, event):
-        self.subthread.quit()
-        self.subthread.wait()
+        self.cancelled_jobs.value = self.gl_next_job - 1
+        for subthread in self.subthreads:
+            subthread.quit()
+        for subthread in self.subthreads:
+            subthread.wait()
+        self.gl_results.close()
+        self.watchdog.stop()
+        logging.debug(self.watchdog.report())
 
 
 class GregoryLeibniz(QtCore.QObject):
-    start = QtCore.Signal(int)
-    progress = QtCore.Signal(float, str)
-    done = QtCore.Signal(float)
+    # Term counts go as floats, because a Qt int stops at 2**31
+    start = QtCore.Signal(int, str, float)
+    progress = QtCore.Signal(int, float, float)
+    done = QtCore.Signal(int, float, float)
+    cancelled = QtCore.Signal(int, float, float)
 
-    def __init__(self, parent=None):
+    def __init__(self, cancelled_jobs, checkpoints=None, parent=None):
         super(GregoryLeibniz, self).__init__(parent)
+        self.cancelled_jobs = cancelled_jobs
+        self.checkpoints = checkpoints
+        self.sizer = chunking.ChunkSizer(CHUNK_TIME)
         self.start.connect(self.calculate)
 
-    @QtCore.Slot(int)
-    def calculate(self, iterations):
+    @QtCore.Slot(int, str, float)
+    def calculate(self, job_id, mode, iterations):
         #logging.debug(QtCore.QThread.currentThreadId())
         #logging.debug(self.currentThread())
-        pi = 0.0
-        for i in xrange(iterations):
-            if i % 2 == 0:
-                pi += 4.0 / (2.0 * i + 1.0)
-            else:
-                pi -= 4.0 / (2.0 * i + 1.0)
-            self.progress.emit((float(i) / float(iterations)) * 100.0, "i={0} pi={1}".format(i, pi))
-            time.sleep(1)
-        self.done.emit(pi)
+        iterations = int(iterations)
+        def progress(i, pi):
+            with trace.span("emit progress", "signal"):
+                self.progress.emit(job_id, float(i), pi)
+        reporter = throttle.Throttle(progress, iterations)
+        try:
+            pi, error = series.evaluate(mode, iterations, reporter,
+                                        cancel.Token(self.cancelled_jobs, job_id), self.checkpoints,
+                                        self.sizer)
+        except kernel.Cancelled as e:
+            reporter.flush()
+            with trace.span("emit cancelled", "signal"):
+                self.cancelled.emit(job_id, float(e.i), e.pi)
+            return
+        reporter.flush()
+        with trace.span("emit done", "signal"):
+            self.done.emit(job_id, pi, error)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,26 @@
 import sys
+import os
 import logging
 import threading
-import Queue
 import time
+import multiprocessing
+import Queue
 
 from PySide import QtGui, QtCore
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import cancel, checkpoints, kernel, notify, plot, protocol, results, scheduler, series, trace, watchdog, workers
+
 logging.basicConfig(level=logging.DEBUG)
 
+#: Number of worker threads.  NumPy lets go of the GIL while it sums a
+#: block, so more than one job can make progress at a time.
+WORKERS = multiprocessing.cpu_count()
+
+#: Most jobs handed to the workers at once.  The rest wait in the
+#: scheduler, most urgent first.
+CONCURRENCY = WORKERS
+
 class MainWindow(QtGui.QMainWindow):
     #: Use this signal to update the status bar message
     updateStatusBar = QtCore.Signal(str)
@@ -24,6 +37,13 @@ class MainWindow(QtGui.QMainWindow):
         start_action.setShortcut("Ctrl+S")
         start_action.triggered.connect(self.on_start_click)
 
+        urgent_action = file_menu.addAction("Start &urgent")
+        urgent_action.setShortcut("Ctrl+U")
+        urgent_action.triggered.connect(self.on_urgent_click)
+
+        accuracy_action = file_menu.addAction("Start to &accuracy...")
+        accuracy_action.triggered.connect(self.on_accuracy_click)
+
         stop_action = file_menu.addAction("S&top")
         stop_action.setShortcut("Ctrl+T")
         stop_action.triggered.connect(self.on_stop_click)
@@ -33,11 +53,26 @@ class MainWindow(QtGui.QMainWindow):
         exit_action.setShortcut(QtGui.QKeySequence.Quit)
         exit_action.triggered.connect(self.close)
 
+        self.mode = series.PLAIN
+        series_menu = self.menuBar().addMenu("&Series")
+        series_group = QtGui.QActionGroup(self)
+        for mode in series.MODES:
+            action = series_menu.addAction(series.NAMES[mode])
+            action.setCheckable(True)
+            action.setChecked(mode == self.mode)
+            action.setData(mode)
+            series_group.addAction(action)
+        series_group.triggered.connect(self.on_series_select)
+
         help_menu = self.menuBar().addMenu("&Help")
         help_action = help_menu.addAction("&Help")
         help_action.setShortcut(QtGui.QKeySequence.HelpContents)
         help_action.triggered.connect(self.on_help)
 
+        trace_action = help_menu.addAction("Record &trace")
+        trace_action.setCheckable(True)
+        trace_action.toggled.connect(self.on_trace_toggle)
+
         centralWidget = QtGui.QWidget(self)
 
         # Create 3 buttons
@@ -55,6 +90,8 @@ class MainWindow(QtGui.QMainWindow):
         self.progress_bar = QtGui.QProgressBar(self)
         # Using self here because I need to reference this in a slot
 
+        self.plot = plot.ConvergencePlot(self)
+
         # Lay them out horizontally
         button_container = QtGui.QWidget(self)
         button_layout = QtGui.QHBoxLayout(button_container)
@@ -66,6 +103,7 @@ class MainWindow(QtGui.QMainWindow):
         centralLayout = QtGui.QVBoxLayout(centralWidget)
         centralLayout.addWidget(button_container)
         centralLayout.addWidget(self.progress_bar)
+        centralLayout.addWidget(self.plot)
         centralWidget.setLayout(centralLayout)
 
         self.setCentralWidget(centralWidget)
@@ -78,23 +116,85 @@ class MainWindow(QtGui.QMainWindow):
 
         self.exit_flag = threading.Event()
         self.gl_in_queue = Queue.Queue()
-        self.gl_out_queue = Queue.Queue()
-        self.gregory_leibniz = GregoryLeibniz(self.exit_flag, self.gl_in_queue, self.gl_out_queue)
-        self.gregory_leibniz.start()
-
-        self.queue_timer = QtCore.QTimer(self)
-        self.queue_timer.timeout.connect(self.check_gl_out_queue)
-        self.queue_timer.start(100)  # Check queue every 100 ms
+        self.gl_doorbell = notify.Doorbell()
+        self.gl_out_queue = Queue.Queue(protocol.QUEUE_SIZE)
+        self.cancelled_jobs = cancel.Watermark()
+        self.gl_next_job = 0
+        self.gl_scheduler = scheduler.Scheduler(CONCURRENCY)
+        self.gl_checkpoints = checkpoints.CheckpointCache()
+        self.gl_results = results.ResultStore()
+        self.gl_started = {}  # job_id -> (mode, iterations, start time)
+        self.gl_tolerances = {}  # job_id -> tolerance asked for, or None
+        self.gregory_leibniz = []
+        for n in xrange(WORKERS):
+            thread = GregoryLeibniz(self.exit_flag, self.cancelled_jobs, self.gl_in_queue, self.gl_out_queue, self.gl_doorbell, self.gl_checkpoints)
+            thread.start()
+            self.gregory_leibniz.append(thread)
+
+        self.gl_notifier = QtCore.QSocketNotifier(self.gl_doorbell.fileno(), QtCore.QSocketNotifier.Read, self)
+        self.gl_notifier.activated.connect(self.check_gl_out_queue)
+        # check_gl_out_queue only runs once a worker has rung the doorbell
+
+        self.watchdog = watchdog.Watchdog(self)
+        self.watchdog.start(paused=True)  # Only watched while jobs run
 
     @QtCore.Slot()
     def on_start_click(self):
-        self.gl_in_queue.put(5)
+        self.start_job(scheduler.NORMAL)
+
+    @QtCore.Slot()
+    def on_urgent_click(self):
+        self.start_job(scheduler.URGENT)
+
+    @QtCore.Slot()
+    def on_accuracy_click(self):
+        places, ok = QtGui.QInputDialog.getInt(self, "Accuracy", "How many decimal places?",
+                                               8, 1, 15)
+        if ok:
+            # As many terms as the series needs for that, and no more
+            tolerance = series.tolerance_for(places)
+            self.start_job(scheduler.NORMAL, series.terms_for(self.mode, tolerance), tolerance)
+
+    def start_job(self, priority, iterations=None, tolerance=None):
+        job_id = self.gl_next_job
+        self.gl_next_job += 1
+        if iterations is None:
+            iterations = series.TERMS[self.mode]
+        stored = self.gl_results.lookup(self.mode, iterations)
+        if stored is not None:
+            self.progress_bar.setValue(100)
+            self.updateStatusBar.emit("pi={0} +/- {1:.1e}{2} (job {3}, stored)".format(
+                stored[0], stored[1], series.missed(stored[1], tolerance), job_id))
+            return
+        self.gl_tolerances[job_id] = tolerance
+        self.gl_scheduler.submit(job_id, priority, [(job_id, self.mode, iterations)])
+        trace.begin("job", job_id, mode=self.mode)
+        self.watchdog.resume()
+        self.dispatch_gl_jobs()
+
+    def dispatch_gl_jobs(self):
+        for job_id, mode, iterations in self.gl_scheduler.ready():
+            self.gl_started[job_id] = (mode, iterations, time.time())
+            self.plot.start(job_id, iterations)
+            with trace.span("queue put", "queue"):
+                self.gl_in_queue.put((job_id, mode, iterations))
 
     @QtCore.Slot()
     def on_stop_click(self):
+        self.cancelled_jobs.value = self.gl_next_job - 1
         self.updateStatusBar.emit("Stop clicked")
+        # Jobs that never got to a worker are cancelled right here
+        for job_id, job in self.gl_scheduler.cancel(self.cancelled_jobs.value):
+            trace.end("job", job_id, cancelled=True)
+            del self.gl_tolerances[job_id]
+            self.updateStatusBar.emit("Cancelled at i=0 pi=0.0 (job {0})".format(job_id))
+
+    @QtCore.Slot(QtGui.QAction)
+    def on_series_select(self, action):
+        self.mode = action.data()
 
     @QtCore.Slot(str)
+    @trace.traced("update_status_bar")
     def update_status_bar(self, message):
         self.statusBar().showMessage(message)
 
@@ -102,11 +202,25 @@ class MainWindow(QtGui.QMainWindow):
     def on_help(self):
         QtGui.QMessageBox.information(self,
                 "Help",
-                "Press Start to start processing.  Press Stop to stop "
+                "Press Start to start processing.  Start urgent jumps the "
+                "queue of waiting jobs.  Press Stop to stop "
                 "processing.  Press Quit to exit the program.",
                 QtGui.QMessageBox.Ok,
                 QtGui.QMessageBox.Ok)
 
+    @QtCore.Slot(bool)
+    def on_trace_toggle(self, checked):
+        if checked:
+            trace.start()
+            self.updateStatusBar.emit("Recording a trace")
+            return
+        trace.stop()
+        path, _ = QtGui.QFileDialog.getSaveFileName(self, "Save trace", "picalc-trace.json",
+                                                    "Chrome traces (*.json)")
+        if path:
+            count = trace.save(path)
+            self.updateStatusBar.emit("Saved {0} trace events to {1}".format(count, path))
+
     @QtCore.Slot(float, str)
     def on_gl_progress(self, value, message):
         self.progress_bar.setValue(value)
@@ -118,55 +232,98 @@ class MainWindow(QtGui.QMainWindow):
         self.updateStatusBar.emit("pi={}".format(value))
 
     @QtCore.Slot()
+    @trace.traced("check_gl_out_queue")
     def check_gl_out_queue(self):
-        while True:
-            message = None
-            try:
-                message = self.gl_out_queue.get_nowait()
-            except Queue.Empty:
-                return  # No more messages.  Exit.
-            if message[0] == "progress":
-                self.progress_bar.setValue(message[1])
-            elif message[0] == "status":
-                self.updateStatusBar.emit(message[1])
-            elif message[0] == "done":
-                self.progress_bar.setValue(100)
-                self.updateStatusBar.emit("pi={}".format(message[1]))
+        progress = None
+        display = None  # (percent, message) for the last job to finish
+        for batch in notify.drain(self.gl_out_queue, self.gl_doorbell.answer()):
+            for record in protocol.unpack(batch):
+                if record.kind == protocol.PROGRESS:
+                    if record.job_id == self.plot.job_id:
+                        self.plot.add(record.i, record.value)
+                    progress = record  # Only the latest one gets formatted
+                elif record.kind == protocol.DONE:
+                    progress = None
+                    self.gl_scheduler.task_done()
+                    trace.end("job", record.job_id)
+                    mode, iterations, started = self.gl_started.pop(record.job_id)
+                    self.gl_results.record(mode, iterations, record.value, record.error, time.time() - started)
+                    if record.job_id == self.plot.job_id:
+                        self.plot.add(iterations, record.value)
+                    display = (100, "pi={0} +/- {1:.1e}{2} (job {3})".format(
+                        record.value, record.error, series.missed(record.error, self.gl_tolerances.pop(record.job_id)),
+                        record.job_id))
+                elif record.kind == protocol.CANCELLED:
+                    progress = None
+                    self.gl_scheduler.task_done()
+                    trace.end("job", record.job_id, cancelled=True)
+                    del self.gl_started[record.job_id]
+                    del self.gl_tolerances[record.job_id]
+                    display = (None, "Cancelled at i={0} pi={1} (job {2})".format(record.i, record.value, record.job_id))
             self.gl_out_queue.task_done()
+        if progress is not None and progress.job_id in self.gl_started:
+            mode, iterations, started = self.gl_started[progress.job_id]
+            display = ((float(progress.i) / float(iterations)) * 100.0,
+                       "i={0} pi={1}".format(progress.i, progress.value))
+        # However many records came in, the bars are set once, from the
+        # latest of them
+        if display is not None:
+            percent, message = display
+            if percent is not None:
+                self.progress_bar.setValue(percent)
+            self.updateStatusBar.emit(message)
+        self.dispatch_gl_jobs()
+        if not self.gl_started:
+            self.watchdog.pause()
 
     def closeEvent(self, event):
-        self.exit_flag.set()
-        self.gregory_leibniz.join()
+        self.cancelled_jobs.value = self.gl_next_job - 1
+        elapsed = workers.shutdown(self.exit_flag, self.gl_in_queue, self.gregory_leibniz)
+        logging.debug("Workers shut down in %.1f ms", elapsed * 1000.0)
+        self.gl_notifier.setEnabled(False)
+        self.gl_doorbell.close()
+        self.gl_results.close()
+        self.watchdog.stop()
+        logging.debug(self.watchdog.report())
 
 
 class GregoryLeibniz(threading.Thread):
-    def __init__(self, exit_flag, in_queue, out_queue):
+    def __init__(self, exit_flag, cancelled_jobs, in_queue, out_queue, doorbell, checkpoints=None):
         super(GregoryLeibniz, self).__init__()
         self.exit_flag = exit_flag
+        self.cancelled_jobs = cancelled_jobs
         self.in_queue = in_queue
         self.out_queue = out_queue
+        self.doorbell = doorbell
+        self.writer = protocol.Writer(out_queue, doorbell, exit_flag=exit_flag)
+        self.checkpoints = checkpoints
 
     def run(self):
         while self.exit_flag.is_set() == False:
-            iterations = None
+            job = self.in_queue.get()  # Sleeps until there's something to do
+            if job is workers.WAKEUP:
+                self.in_queue.task_done()
+                continue  # Go look at exit_flag
+            job_id, mode, iterations = job
             try:
-                iterations = self.in_queue.get_nowait()
-            except Queue.Empty:
-                continue
-            self.out_queue.put(("done", self.calculate(iterations)))
+                pi, error = self.calculate(job_id, mode, iterations)
+                self.writer.add(protocol.DONE, job_id, i=iterations, value=pi, error=error)
+            except kernel.Cancelled as e:
+                self.writer.add(protocol.CANCELLED, job_id, i=e.i, value=e.pi)
+            self.writer.flush()
             self.in_queue.task_done()
 
-    def calculate(self, iterations):
-        pi = 0.0
-        for i in xrange(iterations):
-            if i % 2 == 0:
-                pi += 4.0 / (2.0 * i + 1.0)
-            else:
-                pi -= 4.0 / (2.0 * i + 1.0)
-            self.out_queue.put(("progress", (float(i) / float(iterations)) * 100.0))
-            self.out_queue.put(("status", "i={0} pi={1}".format(i, pi)))
-            time.sleep(1)
-        return pi
+    def calculate(self, job_id, mode, iterations):
+        """
+        Sum the series and return (pi, error).  Progress is sent once per
+        Writer interval, and whatever is left over goes with the done or
+        cancelled record, which supersedes it.
+        """
+        def progress(i, pi):
+            self.writer.add(protocol.PROGRESS, job_id, i=i, value=pi)
+            self.writer.flush_due()
+        return series.evaluate(mode, iterations, progress,
+                               cancel.Token(self.cancelled_jobs, job_id), self.checkpoints)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+"""
+Code shared by the pi stages (7_ through 10_).
+
+The stages live in directories that start with a digit, so they can't be
+imported from each other.  Anything more than one stage needs goes in here
+instead, and each stage's run.py puts the top of the repo on sys.path.
+"""
@@ -0,0 +1,213 @@
+"""
+Headless benchmark of the pi stages.
+
+    python -m picalc.benchmark [--iterations N] [--output FILE] [stage ...]
+
+Each stage's MainWindow is driven the way a user would drive it: Start is
+clicked, and the clock runs until the status bar says "pi=...".  For every
+stage the results have:
+
+wall_time
+    Seconds from Start to done.
+terms_per_second
+    Iterations divided by wall_time.
+messages, messages_per_second
+    Progress updates, each a new (i, pi), that made it to the GUI thread.
+    For 7 and 11, which work pi out on the GUI thread or hand it back
+    there a chunk at a time, that's the "i=..." status bar updates.  For
+    8 it's the progress signals, for 9 the PROGRESS records taken off the
+    out_queue, and for 10 those plus the progress board reads that found
+    something new.
+heartbeat_ms
+    How late a HEARTBEAT ms watchdog timer fired during the run (mean, max
+    and the histogram bucket holding the 99th percentile), which is how
+    long the event loop was kept from doing anything else.
+
+Results are written as JSON, to stdout unless --output is given.  The
+stages each get an empty result store in a temporary directory, so
+nothing is answered from earlier runs.
+
+Stage 11 runs on Python 3 with PySide2 and qasync, so it's benchmarked on
+its own, with python3 -m picalc.benchmark 11_pi_asyncio.  It's driven by
+its asyncio loop's run_forever(), since qasync only runs asyncio callbacks
+in there.  The other stages get a nested QEventLoop.
+
+Qt needs a display.  QT_QPA_PLATFORM is set to offscreen, which is enough
+for Qt builds that have the offscreen platform.  Anywhere else, run it
+under Xvfb (xvfb-run python -m picalc.benchmark).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+try:
+    from PySide import QtCore, QtGui as QtWidgets
+except ImportError:
+    from PySide2 import QtCore, QtWidgets  # Stage 11, on Python 3
+
+from picalc import protocol, series, watchdog
+from picalc.stages import PI_STAGES, load_stage
+
+#: Heartbeat timer interval, in ms
+HEARTBEAT = 5
+
+#: Give up on a stage after this many seconds
+TIMEOUT = 600
+
+
+class CountingQueue(object):
+    """
+    Stands in for the GUI's end of a stage's out_queue, counting the
+    PROGRESS records in the batches taken off it.  The workers keep the
+    real queue.
+    """
+    def __init__(self, queue):
+        self.queue = queue
+        self.count = 0
+
+    def get(self, *args, **kwargs):
+        return self.counted(self.queue.get(*args, **kwargs))
+
+    def get_nowait(self):
+        return self.counted(self.queue.get_nowait())
+
+    def counted(self, batch):
+        self.count += sum(1 for record in protocol.unpack(batch) if record.kind == protocol.PROGRESS)
+        return batch
+
+    def __getattr__(self, name):
+        return getattr(self.queue, name)
+
+
+class CountingBoard(object):
+    """
+    Stands in for the GUI's view of stage 10's progress board, counting
+    the reads that found a slot holding something new.  The workers keep
+    posting to the real board.
+    """
+    def __init__(self, board):
+        self.board = board
+        self.count = 0
+        self.last = [None] * len(board)
+
+    def __len__(self):
+        return len(self.board)
+
+    def read(self, slot):
+        value = self.board.read(slot)
+        if value[0] >= 0 and value != self.last[slot]:
+            self.count += 1
+        self.last[slot] = value
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.board, name)
+
+
+def run_stage(directory, iterations):
+    """
+    Run one Start-to-done cycle of a stage and return its results.
+    """
+    stage = load_stage(directory)
+    asyncio_loop = None
+    if hasattr(stage, "install_event_loop"):
+        asyncio_loop = stage.install_event_loop(QtWidgets.QApplication.instance())  # asyncio on Qt
+    os.environ["PICALC_RESULTS"] = os.path.join(tempfile.mkdtemp(), "results.sqlite")
+    window = stage.MainWindow()
+    window.show()
+
+    counter = {"messages": 0}
+    def count(*args):
+        counter["messages"] += 1
+    def count_status(message):
+        if message.startswith("i="):
+            count()
+    counters = []
+    if hasattr(window, "gl_out_queue"):
+        window.gl_out_queue = CountingQueue(window.gl_out_queue)
+        counters.append(window.gl_out_queue)
+        if getattr(window, "gl_board", None) is not None:
+            window.gl_board = CountingBoard(window.gl_board)
+            counters.append(window.gl_board)
+    elif hasattr(window, "gl_idle"):
+        for worker in window.gregory_leibniz:
+            worker.progress.connect(count)
+    else:
+        window.updateStatusBar.connect(count_status)
+
+    if asyncio_loop is not None:
+        run, stop = asyncio_loop.run_forever, asyncio_loop.stop
+    else:
+        loop = QtCore.QEventLoop()
+        run, stop = loop.exec_, loop.quit
+    finished = {}
+    def on_status(message):
+        if message.startswith("pi=") and "time" not in finished:
+            finished["time"] = time.time()
+            stop()
+    window.updateStatusBar.connect(on_status)
+
+    heartbeat = watchdog.Watchdog(interval=HEARTBEAT)
+    QtCore.QTimer.singleShot(TIMEOUT * 1000, stop)
+    QtCore.QTimer.singleShot(0, window.on_start_click)
+    started = time.time()
+    heartbeat.start()
+    run()
+    heartbeat.stop()
+
+    wall_time = finished.get("time", time.time()) - started
+    counter["messages"] += sum(counting.count for counting in counters)
+    window.close()
+    QtWidgets.QApplication.processEvents()
+    if asyncio_loop is not None:
+        asyncio_loop.close()
+    return {
+        "timed_out": "time" not in finished,
+        "wall_time": wall_time,
+        "terms_per_second": iterations / wall_time,
+        "messages": counter["messages"],
+        "messages_per_second": counter["messages"] / wall_time,
+        "heartbeat_ms": heartbeat.summary(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pi stages without a user.")
+    parser.add_argument("--iterations", type=int, default=series.TERMS[series.PLAIN],
+                        help="number of series terms per run")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("stages", nargs="*", default=PI_STAGES,
+                        help="stage directories to run (default: all of them)")
+    args = parser.parse_args(argv)
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    default_terms = series.TERMS[series.PLAIN]
+    series.TERMS[series.PLAIN] = args.iterations
+    try:
+        results = {
+            "iterations": args.iterations,
+            "cpu_count": multiprocessing.cpu_count(),
+            "python": sys.version.split()[0],
+            "time": time.time(),
+            "stages": dict((directory, run_stage(directory, args.iterations))
+                           for directory in args.stages),
+        }
+    finally:
+        series.TERMS[series.PLAIN] = default_terms
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
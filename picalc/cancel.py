@@ -0,0 +1,34 @@
+"""
+Cooperative cancellation for pi jobs.
+
+Every job gets a number, counting up from 0.  The GUI keeps a watermark,
+the highest job number that has been cancelled, and Stop raises it to the
+newest job.  A worker checks its job's Token between kernel blocks, so a
+cancelled job stops within one block.  Jobs started after Stop get higher
+numbers, so they aren't affected and nothing has to be reset.
+
+The watermark only needs a ``value`` attribute.  Threads can share a plain
+Watermark; worker processes need a multiprocessing.Value("l", -1) handed to
+them when they're started.
+"""
+
+
+class Watermark(object):
+    """
+    Highest cancelled job number, for sharing between threads.
+    """
+    def __init__(self, value=-1):
+        self.value = value
+
+
+class Token(object):
+    """
+    Cancellation token for one job.  Looks enough like threading.Event
+    (``is_set()``) for the kernel to check it.
+    """
+    def __init__(self, watermark, job_id):
+        self.watermark = watermark
+        self.job_id = job_id
+
+    def is_set(self):
+        return self.watermark.value >= self.job_id
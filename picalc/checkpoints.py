@@ -0,0 +1,121 @@
+"""
+In-memory cache of plain series checkpoints.
+
+Every Start used to sum the series from the first term.  A
+CheckpointCache keeps (i, total, compensation) for some of the partial
+sums it has seen, i.e. the compensated sum of the first i terms.  A run
+for N terms then only has to sum from the largest checkpoint at or below
+N.  Asking for the same N again costs nothing, and asking for 10**8 after
+10**7 only sums the last 9 * 10**7 terms.
+
+Checkpoints are kept at geometric intervals, whenever i is a power of two
+number of kernel blocks, plus at the end of every run.  That is about
+log2(N) entries for a run, however long it is.  Once the cache grows past
+its memory cap, the least recently used checkpoints are thrown out.
+
+The cache can be shared between threads.  It can't be shared between
+processes, so stage 10 keeps its cache on the GUI side and feeds the
+workers only the missing tail.
+"""
+import collections
+import threading
+
+from picalc import kernel
+
+#: Default memory cap, in bytes
+MEMORY = 1 << 20
+
+#: Rough cost of one checkpoint in the cache, counting the dict entry, the
+#: key and the two floats
+ENTRY_BYTES = 200
+
+
+def is_mark(i, block_size=kernel.BLOCK_SIZE):
+    """
+    Return True if a checkpoint should be kept at i.
+    """
+    blocks, rest = divmod(i, block_size)
+    return rest == 0 and blocks > 0 and blocks & (blocks - 1) == 0
+
+
+def next_mark(i, block_size=kernel.BLOCK_SIZE):
+    """
+    Return the first point past i where a checkpoint should be kept.
+    """
+    return (1 << (i // block_size).bit_length()) * block_size
+
+
+class CheckpointCache(object):
+    def __init__(self, memory=MEMORY):
+        self.capacity = max(1, memory // ENTRY_BYTES)
+        self.entries = collections.OrderedDict()  # i -> (total, compensation)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, iterations):
+        """
+        Return (i, total, compensation) for the largest checkpoint at or
+        below ``iterations``, or (0, 0.0, 0.0) if there isn't one.
+        """
+        with self.lock:
+            best = 0
+            for i in self.entries:
+                if best < i <= iterations:
+                    best = i
+            if not best:
+                self.misses += 1
+                return 0, 0.0, 0.0
+            self.hits += 1
+            total, compensation = self.entries.pop(best)
+            self.entries[best] = (total, compensation)  # Now most recently used
+            return best, total, compensation
+
+    def store(self, i, total, compensation):
+        with self.lock:
+            self.entries.pop(i, None)
+            self.entries[i] = (total, compensation)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def extend(self, start, stop, sums, total=0.0, compensation=0.0, last=True):
+        """
+        Add up the block sums for start..stop-1 on top of the checkpoint at
+        start, keeping a checkpoint at every mark.  Returns the (total,
+        compensation) at stop.
+
+        A run handed in as several sub-ranges should pass ``last`` only for
+        the final one, so that a checkpoint is kept at the end of the run
+        but not at every arbitrary chunk boundary on the way.
+        """
+        for (lo, hi), value in zip(kernel.block_bounds(stop, start), sums):
+            total, compensation = kernel.neumaier_add(total, compensation, value)
+            if is_mark(hi):
+                self.store(hi, total, compensation)
+        if last:
+            self.store(stop, total, compensation)
+        return total, compensation
+
+    def gregory_leibniz(self, iterations, progress=None, cancel=None, sizer=None):
+        """
+        Same as kernel.gregory_leibniz(), but starting from the nearest
+        checkpoint and leaving new ones behind.  If the run is cancelled,
+        the checkpoints it got to are still kept.  If given, ``sizer`` (a
+        chunking.ChunkSizer) groups the blocks into chunks, which end at
+        every checkpoint mark so that none is skipped.
+        """
+        i, total, compensation = self.lookup(iterations)
+        if progress is not None and i:
+            progress(i, total + compensation)
+        chunks = sizer.chunks(iterations, i, next_mark) if sizer is not None else None
+        for i, total, compensation in kernel.compensated_sums(iterations, i, total, compensation,
+                                                              cancel=cancel, chunks=chunks):
+            if is_mark(i):
+                self.store(i, total, compensation)
+            if progress is not None:
+                progress(i, total + compensation)
+        self.store(iterations, total, compensation)
+        return total + compensation
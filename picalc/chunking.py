@@ -0,0 +1,81 @@
+"""
+Sizing chunks of work by how long they take.
+
+A fixed chunk size is wrong somewhere: too small on a fast machine, where
+the per-chunk overhead adds up, and too big on a slow or busy one, where
+progress stalls and Stop takes a while.  A ChunkSizer times every chunk
+and aims the next one at ``target`` seconds.  It keeps a moving average
+of the time per kernel block, so chunks grow as things warm up and shrink
+when the workers start competing for the CPU.  The size at most doubles
+or halves from one chunk to the next, so one odd measurement can't throw
+it far off.
+
+Chunks are always made of whole kernel blocks, on the kernel's block
+grid, so chunking never changes the answer.
+"""
+import time
+
+from picalc import kernel
+
+#: Default wall time to aim every chunk at, in seconds
+TARGET = 0.02
+
+#: Weight of the newest measurement in the moving average
+SMOOTHING = 0.5
+
+#: Biggest chunk, in blocks
+MAX_BLOCKS = 1 << 14
+
+
+def blocks_in(lo, hi, block_size=kernel.BLOCK_SIZE):
+    """
+    Return how many grid blocks lo..hi-1 touches.
+    """
+    return -(-hi // block_size) - lo // block_size
+
+
+class ChunkSizer(object):
+    def __init__(self, target=TARGET, blocks=1, block_size=kernel.BLOCK_SIZE):
+        self.target = target
+        self.blocks = blocks
+        self.block_size = block_size
+        self.seconds_per_block = None
+
+    def record(self, blocks, seconds):
+        """
+        Take the time a chunk of ``blocks`` blocks took into account.
+        """
+        if blocks <= 0:
+            return
+        sample = seconds / blocks
+        if self.seconds_per_block is None:
+            self.seconds_per_block = sample
+        else:
+            self.seconds_per_block += SMOOTHING * (sample - self.seconds_per_block)
+        wanted = int(self.target / max(self.seconds_per_block, 1e-9))
+        self.blocks = max(1, self.blocks // 2, min(wanted, self.blocks * 2, MAX_BLOCKS))
+
+    def cut(self, start, stop):
+        """
+        Return where a chunk beginning at start should end.
+        """
+        return min(stop, (start // self.block_size + self.blocks) * self.block_size)
+
+    def chunks(self, stop, start=0, align=None):
+        """
+        Generate (lo, hi) chunks covering start..stop-1, for passing to
+        the kernel.  Each chunk is timed from when it's generated until the
+        next one is asked for, so the caller's own work on it counts too.
+
+        If given, ``align(lo)`` returns a point past lo that the chunk
+        starting at lo mustn't go beyond.
+        """
+        lo = start
+        while lo < stop:
+            hi = self.cut(lo, stop)
+            if align is not None:
+                hi = min(hi, align(lo))
+            began = time.time()
+            yield lo, hi
+            self.record(blocks_in(lo, hi, self.block_size), time.time() - began)
+            lo = hi
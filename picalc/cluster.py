@@ -0,0 +1,327 @@
+"""
+Spreading one plain series run over several machines.
+
+A coordinator listens on a TCP port and cuts the run into chunks of
+CHUNK_BLOCKS kernel blocks.  Nodes connect to it, each one running the
+stage 10 GregoryLeibniz workers through the headless Batch, and are kept
+one chunk ahead of their worker count.  A node sends back the block sums
+of every chunk it finishes, and a heartbeat every HEARTBEAT seconds.  A
+node that hangs up, or hasn't been heard from for DEAD_AFTER seconds, is
+dropped, and its unfinished chunks are handed to the others.
+
+    python -m picalc.cluster --listen HOST:PORT [--iterations N]
+    python 10_pi_multiprocessing/run.py --headless --connect HOST:PORT [--workers N]
+
+To try it out on one machine, the coordinator can start some nodes on
+localhost itself, and kill one of them part way through:
+
+    python -m picalc.cluster --local 3 [--kill-after SECONDS]
+
+Messages are pickled tuples on multiprocessing.connection connections,
+which check ``--authkey`` (or PICALC_AUTHKEY) with HMAC when a node
+connects.  Pickles can run code, so only put the coordinator on a network
+the nodes trust.
+
+    node to coordinator:  ("hello", name, workers)
+                          ("heartbeat",)
+                          ("result", chunk, start, i, sums)
+    coordinator to node:  ("task", chunk, start, stop)
+                          ("quit",)
+
+The coordinator writes JSON lines to stdout, like the headless mode does.
+Only the partial sum of each chunk, rounded to two floats, is kept, so the
+coordinator's memory doesn't grow with the block count, and pi comes out
+the same however the chunks were spread over the nodes.
+"""
+import argparse
+import collections
+import math
+import multiprocessing.connection
+import os
+import Queue
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from picalc import headless, kernel, notify, protocol, series, throttle
+
+#: Kernel blocks per chunk.  A chunk is the most work that has to be done
+#: again when a node is lost.
+CHUNK_BLOCKS = 256
+
+#: Seconds between heartbeats from a node
+HEARTBEAT = 1.0
+
+#: Seconds without hearing from a node before it is given up on
+DEAD_AFTER = 5.0
+
+#: Seconds between progress lines from the coordinator
+PROGRESS_INTERVAL = 1.0
+
+_STAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                      "10_pi_multiprocessing", "run.py")
+
+
+def default_authkey():
+    return os.environ.get("PICALC_AUTHKEY", "picalc")
+
+
+def parse_address(text):
+    """
+    Turn "host:port" into (host, port).
+    """
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class NodeState(object):
+    """
+    Coordinator-side bookkeeping for one connected node.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.name = None
+        self.capacity = 0  # Unknown until it says hello
+        self.chunks = set()
+        self.last_seen = time.time()
+
+
+class Coordinator(object):
+    """
+    Hands the chunks of one run out to whichever nodes connect to
+    ``listener``, until every chunk is done.
+    """
+    def __init__(self, listener, iterations, chunk_blocks=CHUNK_BLOCKS):
+        self.listener = listener
+        self.iterations = iterations
+        blocks = -(-iterations // kernel.BLOCK_SIZE)
+        self.ranges = kernel.split_range(iterations, -(-blocks // chunk_blocks))
+        self.pending = collections.deque(xrange(len(self.ranges)))
+        self.partials = {}  # chunk -> (sum, rounding error of the sum)
+        self.completed = 0
+        self.nodes = {}  # connection -> NodeState
+        self.doorbell = notify.Doorbell()
+        self.arrivals = Queue.Queue()
+        self.progress = throttle.Throttle(self.report, iterations, interval=PROGRESS_INTERVAL)
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        """
+        Take new connections, on a thread of its own, and ring the doorbell
+        for each one.
+        """
+        while True:
+            try:
+                connection = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except (IOError, OSError, EOFError):
+                return  # The listener was closed
+            self.arrivals.put(connection)
+            self.doorbell.ring()
+
+    def pi(self):
+        return kernel.reduce_block_sums([value for pair in self.partials.itervalues()
+                                         for value in pair])
+
+    def report(self, i, pi):
+        headless.emit("progress", 0, i=i, pi=pi, nodes=len(self.nodes))
+
+    def run(self):
+        """
+        Wait for every chunk to be done and return pi.
+        """
+        while len(self.partials) < len(self.ranges):
+            try:
+                readable = select.select([self.doorbell] + self.nodes.keys(), [], [], HEARTBEAT)[0]
+            except select.error:
+                continue  # Interrupted by a signal
+            if self.doorbell in readable:
+                self.doorbell.answer()
+                while not self.arrivals.empty():
+                    connection = self.arrivals.get()
+                    self.nodes[connection] = NodeState(connection)
+            for connection in readable:
+                if connection in self.nodes:
+                    self.receive(self.nodes[connection])
+            now = time.time()
+            for node in self.nodes.values():
+                if now - node.last_seen > DEAD_AFTER:
+                    self.lose(node, "timed out")
+            self.assign()
+        return self.pi()
+
+    def receive(self, node):
+        try:
+            while node.connection.poll():
+                self.handle(node, node.connection.recv())
+        except (EOFError, IOError):
+            self.lose(node, "hung up")
+            return
+        node.last_seen = time.time()
+
+    def handle(self, node, message):
+        if message[0] == "hello":
+            node.name, node.capacity = message[1:]
+            headless.emit("node", 0, name=node.name, workers=node.capacity)
+        elif message[0] == "result":
+            chunk, start, i, sums = message[1:]
+            node.chunks.discard(chunk)
+            if chunk in self.partials:
+                return  # Already done by a node it was handed to after this one timed out
+            if i < self.ranges[chunk][1]:
+                self.pending.appendleft(chunk)  # The node cancelled it
+                return
+            total = math.fsum(sums)
+            self.partials[chunk] = (total, math.fsum(sums + [-total]))
+            self.completed += i - start
+            self.progress(self.completed, self.pi())
+
+    def lose(self, node, reason):
+        del self.nodes[node.connection]
+        node.connection.close()
+        for chunk in sorted(node.chunks, reverse=True):
+            if chunk not in self.partials:
+                self.pending.appendleft(chunk)
+        headless.emit("lost", 0, name=node.name, reason=reason, chunks=len(node.chunks))
+
+    def assign(self):
+        """
+        Keep every node one chunk ahead of its workers, so none of them
+        waits on a round trip.
+        """
+        for node in self.nodes.values():
+            while self.pending and node.capacity and len(node.chunks) <= node.capacity:
+                chunk = self.pending.popleft()
+                if chunk in self.partials:
+                    continue
+                start, stop = self.ranges[chunk]
+                try:
+                    node.connection.send(("task", chunk, start, stop))
+                except (IOError, OSError):
+                    self.pending.appendleft(chunk)
+                    self.lose(node, "hung up")
+                    break
+                node.chunks.add(chunk)
+
+    def close(self):
+        for node in self.nodes.values():
+            try:
+                node.connection.send(("quit",))
+            except (IOError, OSError):
+                pass
+            node.connection.close()
+        self.nodes = {}
+        self.listener.close()
+        self.doorbell.close()
+
+
+class Node(headless.Batch):
+    """
+    Runs the chunks a coordinator sends on a set of stage 10 workers.
+    """
+    def __init__(self, stage, backend, count, address, authkey):
+        super(Node, self).__init__(stage, backend, count)
+        self.connection = multiprocessing.connection.Client(address, authkey=authkey)
+        self.connection.send(("hello", socket.gethostname(), count))
+
+    def run(self):
+        """
+        Work until the coordinator says quit or goes away.
+        """
+        last_sent = time.time()
+        while True:
+            try:
+                readable = select.select([self.connection, self.doorbell], [], [], HEARTBEAT)[0]
+            except select.error:
+                continue  # Interrupted by a signal
+            if self.connection in readable:
+                try:
+                    while self.connection.poll():
+                        message = self.connection.recv()
+                        if message[0] == "quit":
+                            return
+                        chunk, start, stop = message[1:]
+                        self.in_queue.put((chunk, series.PLAIN, start, stop))
+                except (EOFError, IOError):
+                    return
+            if self.doorbell in readable:
+                for batch in notify.drain(self.out_queue, self.doorbell.answer()):
+                    for record in protocol.unpack(batch):
+                        if record.kind != protocol.PROGRESS:
+                            self.connection.send(("result", record.job_id, record.start,
+                                                  record.i, record.payload))
+                            last_sent = time.time()
+            if time.time() - last_sent >= HEARTBEAT:
+                self.connection.send(("heartbeat",))
+                last_sent = time.time()
+
+    def close(self):
+        # Drop whatever is still queued or running, then stop the workers
+        self.cancelled_jobs.value = sys.maxint
+        while True:
+            try:
+                self.in_queue.get(timeout=0.1)
+            except Queue.Empty:
+                break
+        super(Node, self).close()
+        self.connection.close()
+
+
+def start_local_nodes(address, authkey, count):
+    """
+    Start ``count`` single worker nodes on this machine, each in a process
+    group of its own so that it can be killed whole, like a lost machine.
+    """
+    return [subprocess.Popen([sys.executable, _STAGE, "--headless", "--connect",
+                              "{0}:{1}".format(*address), "--workers", "1",
+                              "--authkey", authkey],
+                             preexec_fn=os.setsid)
+            for n in xrange(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m picalc.cluster",
+                                     description="Coordinate a plain series run over several nodes.")
+    parser.add_argument("--listen", type=parse_address, default=("127.0.0.1", 0),
+                        help="HOST:PORT to take nodes on (default: a free port on localhost)")
+    parser.add_argument("--iterations", type=int, default=series.TERMS[series.PLAIN],
+                        help="number of series terms")
+    parser.add_argument("--authkey", default=default_authkey(),
+                        help="shared secret the nodes must know (default: $PICALC_AUTHKEY)")
+    parser.add_argument("--local", type=int, default=0, metavar="N",
+                        help="start N nodes on this machine")
+    parser.add_argument("--kill-after", type=float, metavar="SECONDS",
+                        help="kill the first local node this long after starting")
+    args = parser.parse_args(argv)
+
+    listener = multiprocessing.connection.Listener(args.listen, authkey=args.authkey)
+    headless.emit("listening", 0, address="{0}:{1}".format(*listener.address))
+    coordinator = Coordinator(listener, args.iterations)
+    nodes = start_local_nodes(listener.address, args.authkey, args.local)
+    if nodes and args.kill_after is not None:
+        timer = threading.Timer(args.kill_after, os.killpg, (nodes[0].pid, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+    started = time.time()
+    try:
+        pi = coordinator.run()
+        headless.emit("done", 0, pi=pi, error=series.error_bound(args.iterations),
+                      elapsed=time.time() - started)
+    except KeyboardInterrupt:
+        headless.emit("cancelled", 0, i=coordinator.completed, pi=coordinator.pi())
+    finally:
+        coordinator.close()
+        for node in nodes:
+            node.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Arbitrary precision pi, using the Chudnovsky series and binary splitting.
+
+Each term of the Chudnovsky series adds about 14 digits.  Binary splitting
+turns the sum of terms a..b-1 into three integers (P, Q, T), and two
+neighbouring ranges combine with a few multiplications, so the series can
+be worked out a range at a time, with progress and a look at the cancel
+token in between, and put back together afterwards.
+
+Python 2 divides and converts longs to decimal in quadratic time, which
+is hopeless for a million digits.  So the one division and the square
+root are done with Newton's method using only multiplication, and pi is
+kept as a binary fixed point number.  Its decimal digits come out CHUNK at
+a time by multiplying the fraction by 10**CHUNK, so they can be streamed
+as they're produced.
+"""
+import math
+
+from picalc import kernel
+
+#: Job mode for digit jobs, alongside the series.MODES
+MODE = "digits"
+
+#: Number of decimal digits produced per chunk
+CHUNK = 10000
+
+#: Extra bits carried through the fixed point arithmetic
+GUARD_BITS = 64
+
+_C = 640320
+_C3_OVER_24 = _C ** 3 // 24
+_DIGITS_PER_TERM = math.log10(_C3_OVER_24 / 72.0)
+_BITS_PER_DIGIT = math.log(10, 2)
+
+
+def terms_needed(digits):
+    """
+    Number of Chudnovsky terms needed for ``digits`` digits.
+    """
+    return int(digits / _DIGITS_PER_TERM) + 2
+
+
+def split(a, b):
+    """
+    Return (P, Q, T) for terms a..b-1.
+    """
+    if b - a == 1:
+        if a == 0:
+            p = q = 1
+        else:
+            p = (6 * a - 5) * (2 * a - 1) * (6 * a - 1)
+            q = a * a * a * _C3_OVER_24
+        t = p * (13591409 + 545140134 * a)
+        if a % 2:
+            t = -t
+        return p, q, t
+    m = (a + b) // 2
+    return combine(split(a, m), split(m, b))
+
+
+def combine(left, right, need_p=True):
+    """
+    Combine (P, Q, T) for terms a..m-1 with (P, Q, T) for m..b-1.  The very
+    last combine doesn't need P, which saves the biggest multiplication.
+    """
+    p1, q1, t1 = left
+    p2, q2, t2 = right
+    return (p1 * p2 if need_p else None), q1 * q2, t1 * q2 + p1 * t2
+
+
+def combine_all(results, cancel=None):
+    """
+    Combine a list of (P, Q, T) for consecutive ranges, halving the list
+    each time so the multiplications stay balanced.  ``cancel`` is checked
+    before every combine.
+    """
+    while len(results) > 1:
+        need_p = len(results) > 2
+        pairs = []
+        for k in range(0, len(results) - 1, 2):
+            if cancel is not None and cancel.is_set():
+                raise kernel.Cancelled(0, 0.0)
+            pairs.append(combine(results[k], results[k + 1], need_p))
+        if len(results) % 2:
+            pairs.append(results[-1])
+        results = pairs
+    return results[0]
+
+
+def inverse_sqrt(a, bits):
+    """
+    Return about 2**bits / sqrt(a) for a small positive integer a.
+    """
+    if bits <= 50:
+        return int((1 << bits) / math.sqrt(a))
+    half = bits // 2 + 16
+    y = inverse_sqrt(a, half) << (bits - half)
+    error = (1 << (2 * bits)) - a * y * y
+    return y + ((y * error) >> (2 * bits + 1))
+
+
+def reciprocal(t, bits):
+    """
+    Return about 2**(n + bits) / t, where n is t.bit_length().  Only the top
+    bits + GUARD_BITS bits of t are used.
+    """
+    n = t.bit_length()
+    keep = bits + GUARD_BITS
+    if n > keep:
+        t >>= n - keep
+        n = keep
+    if bits <= 50:
+        shift = max(0, n - 60)
+        return (1 << (n - shift + bits)) // (t >> shift)
+    half = bits // 2 + 16
+    r = reciprocal(t, half) << (bits - half)
+    scale = n + bits
+    error = (1 << scale) - t * r
+    return r + ((r * error) >> scale)
+
+
+def ratio(q, t, bits):
+    """
+    Return about q * 2**bits / t for positive q and t.
+    """
+    keep = bits + GUARD_BITS
+    q_shift = max(0, q.bit_length() - keep)
+    t_shift = max(0, t.bit_length() - keep)
+    q >>= q_shift
+    t >>= t_shift
+    n = t.bit_length()
+    shift = n + GUARD_BITS - q_shift + t_shift
+    x = q * reciprocal(t, bits + GUARD_BITS)
+    return x >> shift if shift >= 0 else x << -shift
+
+
+def fixed_point(q, t, bits):
+    """
+    Return pi * 2**bits, from the combined Q and T of the series.
+    """
+    sqrt_10005 = 10005 * inverse_sqrt(10005, bits)
+    return (426880 * sqrt_10005 * ratio(q, abs(t), bits)) >> bits
+
+
+def decimal_chunks(pi, bits, digits, chunk=CHUNK, cancel=None):
+    """
+    Generate the decimal digits of the fixed point number pi / 2**bits.
+
+    The first chunk starts with the integer part and a ".", then come
+    ``digits`` fractional digits, ``chunk`` at a time.
+    """
+    mask = (1 << bits) - 1
+    fraction = pi & mask
+    prefix = str(pi >> bits) + "."
+    done = 0
+    while done < digits:
+        if cancel is not None and cancel.is_set():
+            raise kernel.Cancelled(done, 0.0)
+        n = min(chunk, digits - done)
+        fraction *= 10 ** n
+        text = str(fraction >> bits).zfill(n)
+        fraction &= mask
+        done += n
+        yield prefix + text
+        prefix = ""
+
+
+def pi_digits(digits, parts=1, progress=None, cancel=None):
+    """
+    Generate pi to ``digits`` decimal places, as text, CHUNK digits at a
+    time.
+
+    The series is split into ``parts`` ranges, worked out one after the
+    other.  ``progress(i, total)`` is called with the number of series
+    terms done as each range is finished.  ``cancel`` is checked between
+    ranges, between combines and between chunks.  Cancelled.i is the
+    number of terms done, or once the digits start coming out, the number
+    of digits done, and 0 in between.
+    """
+    terms = terms_needed(digits)
+    results = []
+    done = 0
+    for a, b in kernel.split_range(terms, parts, block_size=2):
+        if cancel is not None and cancel.is_set():
+            raise kernel.Cancelled(done, 0.0)
+        results.append(split(a, b))
+        done += b - a
+        if progress is not None:
+            progress(done, terms)
+    p, q, t = combine_all(results, cancel)
+    bits = int(digits * _BITS_PER_DIGIT) + GUARD_BITS
+    pi = fixed_point(q, t, bits)
+    for text in decimal_chunks(pi, bits, digits, cancel=cancel):
+        yield text
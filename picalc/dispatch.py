@@ -0,0 +1,122 @@
+"""
+Picking where a job runs, from how big it is.
+
+Stage 10 can run a job three ways:
+
+INLINE
+    Right there in the slot that started it.  There's no hand-off, so a
+    small job is done before the slot returns, but the GUI is frozen for
+    as long as it runs.
+THREAD
+    On a worker thread in the GUI process.  The hand-off is a queue put
+    and a doorbell ring, and the job gets one core, shared with the GUI.
+PROCESS
+    On the pool of worker processes, a chunk at a time.  Every chunk is
+    pickled and goes through a pipe each way, but the job gets every core.
+
+A Dispatcher estimates a job's run time from a cost per term, timed on
+the GUI thread at startup and kept up to date from the workers' reports.
+That's what a plain series term costs.  A pairwise term costs PAIRS_COST
+times as much, and the Euler transform's time grows with the square of
+its terms.  Plain and pairwise jobs estimated to take under INLINE_TIME
+run inline.  The accelerated modes never do, since numpy's overhead on
+their small arrays swamps the estimate.  The rest go to the processes if
+spreading them over the cores saves more than the processes' extra
+hand-off latency, and to the thread otherwise.  The hand-off latencies
+are measured by pinging each backend.
+"""
+import time
+
+from picalc import digits, kernel, series
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+AUTO = "auto"
+
+#: Choices for the Backend menu
+BACKENDS = [AUTO, INLINE, THREAD, PROCESS]
+
+#: Menu text for each choice
+NAMES = {
+    AUTO: "&Automatic",
+    INLINE: "&Inline",
+    THREAD: "&Thread",
+    PROCESS: "&Process",
+}
+
+#: Task mode that a worker answers straight away, for timing a round trip
+PING = "ping"
+
+#: Longest a job can be expected to take and still run inline, in seconds
+INLINE_TIME = 0.0005
+
+#: Time for a pairwise series term, relative to a plain one
+PAIRS_COST = 4.0
+
+#: Round trip latencies, in seconds, to go on until they've been measured
+LATENCY = {THREAD: 0.001, PROCESS: 0.005}
+
+#: Weight of the newest measurement in the moving averages
+SMOOTHING = 0.2
+
+
+class Dispatcher(object):
+    def __init__(self, workers):
+        self.workers = workers
+        self.seconds_per_term = None
+        self.latency = dict(LATENCY)
+        self.measured = set()
+
+    def calibrate(self, blocks=4):
+        """
+        Time the kernel on the calling thread.  Takes about a millisecond.
+        """
+        kernel.block_sums(kernel.BLOCK_SIZE)  # Builds the tables
+        began = time.time()
+        kernel.block_sums(blocks * kernel.BLOCK_SIZE)
+        self.seconds_per_term = (time.time() - began) / (blocks * kernel.BLOCK_SIZE)
+
+    def record_rate(self, terms, seconds):
+        """
+        Take the time a plain series run of ``terms`` terms took into
+        account.
+        """
+        if terms > 0:
+            self.seconds_per_term += SMOOTHING * (seconds / terms - self.seconds_per_term)
+
+    def record_latency(self, backend, seconds):
+        if backend in self.measured:
+            self.latency[backend] += SMOOTHING * (seconds - self.latency[backend])
+        else:
+            self.latency[backend] = seconds
+            self.measured.add(backend)
+
+    def estimate(self, mode, terms):
+        """
+        Return about how many seconds ``terms`` terms of ``mode`` take.
+        """
+        if mode == series.PLAIN:
+            return terms * self.seconds_per_term
+        if mode == series.PAIRS:
+            return terms * self.seconds_per_term * PAIRS_COST
+        terms = min(terms, series.MAX_ACCELERATED)
+        if mode == series.EULER:
+            return terms * terms * self.seconds_per_term  # Every round averages every sum
+        return terms * self.seconds_per_term
+
+    def choose(self, mode, terms):
+        """
+        Return the backend for a job of ``terms`` terms that haven't been
+        summed yet.
+        """
+        if mode == digits.MODE:
+            return PROCESS  # Digits jobs have a process pool of their own
+        seconds = self.estimate(mode, terms)
+        if seconds <= INLINE_TIME and mode in (series.PLAIN, series.PAIRS):
+            return INLINE
+        parts = self.workers if mode == series.PLAIN else 1  # Only the plain series gets split up
+        saved = seconds * (1.0 - 1.0 / parts)
+        if saved > self.latency[PROCESS] - self.latency[THREAD]:
+            return PROCESS
+        return THREAD
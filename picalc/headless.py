@@ -0,0 +1,303 @@
+"""
+Running the stage 10 workers without a display.
+
+    python 10_pi_multiprocessing/run.py --headless [--iterations N]
+        [--tolerance ERROR | --places N] [--mode MODE] [--digits N]
+        [--backend process|thread] [--workers N] [--stdin] [--fresh]
+        [--connect HOST:PORT [--authkey KEY]]
+
+run.py hands itself over before it imports Qt, so this works on compute
+nodes and in cron jobs.  The jobs are run by the same GregoryLeibniz
+workers and PartitionedJob bookkeeping as the GUI uses.  The workers run
+as processes (the default) or as threads in this process.
+
+With --stdin, one job spec is read per line, as a JSON object, e.g.
+
+    {"id": "a", "iterations": 100000000, "mode": "plain", "priority": 0}
+    {"tolerance": 1e-6, "mode": "pairs"}
+    {"places": 12, "mode": "richardson"}
+    {"digits": 10000}
+
+A bare number is taken as an iteration count.  Otherwise the one job
+given by --iterations/--tolerance/--places/--mode or --digits is run.
+
+A job with a ``tolerance`` (an absolute error) or a number of decimal
+``places`` is run for as many terms as its mode needs to get there (see
+series.terms_for()).  Its done event also has the tolerance, the
+iterations used and ``met``, which is false if the error, the bound it
+got to, is more than the tolerance.  terms_for() stops short of a
+tolerance finer than rounding error allows, or than MAX_TERMS terms get.
+
+Everything that happens is written to stdout as JSON lines:
+
+    {"event": "progress", "job": ..., "i": ..., "pi": ...}
+    {"event": "digits", "job": ..., "text": ...}
+    {"event": "done", "job": ..., "pi": ..., "error": ..., "elapsed": ...}
+    {"event": "cancelled", "job": ..., "i": ..., "pi": ...}
+
+Like the GUI, finished results are kept in the result store and looked up
+before anything is started, unless --fresh is given.  Ctrl+C cancels
+every job that hasn't finished.
+
+With --connect, no jobs are run here; the workers are lent to a cluster
+coordinator instead (see picalc.cluster).
+"""
+import argparse
+import json
+import multiprocessing
+import Queue
+import select
+import signal
+import sys
+import threading
+import time
+
+from picalc import cancel, digits, kernel, notify, protocol, results, scheduler, series, workers
+
+BACKENDS = ["process", "thread"]
+
+
+def emit(event, job, **fields):
+    fields["event"] = event
+    fields["job"] = job
+    sys.stdout.write(json.dumps(fields, sort_keys=True) + "\n")
+    sys.stdout.flush()
+
+
+def read_specs(lines):
+    """
+    Parse job specs, one per line, skipping blank ones.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        spec = json.loads(line)
+        if not isinstance(spec, dict):
+            spec = {"iterations": int(spec)}
+        yield spec
+
+
+class Batch(object):
+    """
+    Runs job specs on a set of workers until they have all finished.
+    """
+    def __init__(self, stage, backend, count, store=None):
+        self.stage = stage
+        self.count = count
+        self.store = store
+        self.doorbell = notify.Doorbell()
+        if backend == "process":
+            self.exit_flag = multiprocessing.Event()
+            self.in_queue = multiprocessing.Queue()
+            self.out_queue = multiprocessing.Queue(protocol.QUEUE_SIZE)
+            self.cancelled_jobs = multiprocessing.Value("l", -1)
+            worker_type = multiprocessing.Process
+        else:
+            self.exit_flag = threading.Event()
+            self.in_queue = Queue.Queue()
+            self.out_queue = Queue.Queue(protocol.QUEUE_SIZE)
+            self.cancelled_jobs = cancel.Watermark()
+            worker_type = threading.Thread
+        self.workers = []
+        # Ctrl+C goes to the whole process group.  Worker processes ignore it
+        # and leave it to this one to cancel the jobs.
+        handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            for n in xrange(count):
+                worker = worker_type(target=stage.gl_process, args=(
+                    self.exit_flag, self.cancelled_jobs, self.in_queue, self.out_queue, self.doorbell))
+                worker.start()
+                self.workers.append(worker)
+        finally:
+            signal.signal(signal.SIGINT, handler)
+        self.scheduler = scheduler.Scheduler(count)
+        self.jobs = {}
+        self.names = {}
+        self.keys = {}  # job_id -> (mode, iterations), for the result store
+        self.targets = {}  # job_id -> extra fields for the done event of a tolerance job
+        self.started = {}
+        self.next_job = 0
+
+    def submit(self, spec):
+        job_id = self.next_job
+        self.next_job += 1
+        name = spec.get("id", job_id)
+        priority = spec.get("priority", scheduler.NORMAL)
+        if "digits" in spec:
+            count = int(spec["digits"])
+            self.jobs[job_id] = self.stage.DigitsJob(count)
+            tasks = [(job_id, digits.MODE, 0, count)]
+        else:
+            mode = spec.get("mode", series.PLAIN)
+            if mode not in series.MODES:
+                raise ValueError("Unknown series mode {0!r}".format(mode))
+            target = {}
+            tolerance = None
+            if "tolerance" in spec or "places" in spec:
+                if "tolerance" in spec:
+                    tolerance = float(spec["tolerance"])
+                else:
+                    tolerance = series.tolerance_for(int(spec["places"]))
+                iterations = series.terms_for(mode, tolerance)
+                target = {"tolerance": tolerance, "iterations": iterations}
+            else:
+                iterations = int(spec.get("iterations", series.TERMS[mode]))
+            stored = self.store.lookup(mode, iterations) if self.store is not None else None
+            if stored is not None:
+                if target:
+                    target["met"] = stored[1] <= tolerance
+                emit("done", name, pi=stored[0], error=stored[1], elapsed=stored[2], stored=True,
+                     **target)
+                return
+            if mode == series.PLAIN:
+                ranges = kernel.split_range(iterations, self.count)
+            else:
+                ranges = [(0, iterations)]
+            self.jobs[job_id] = self.stage.PartitionedJob(iterations, ranges, tolerance=tolerance)
+            tasks = [(job_id, mode, start, stop) for start, stop in ranges]
+            self.keys[job_id] = (mode, iterations)
+            self.targets[job_id] = target
+        self.names[job_id] = name
+        self.started[job_id] = time.time()
+        self.scheduler.submit(job_id, priority, tasks)
+
+    def dispatch(self):
+        for task in self.scheduler.ready():
+            self.in_queue.put(task)
+
+    def cancel(self):
+        self.cancelled_jobs.value = self.next_job - 1
+        for job_id, (_, mode, start, stop) in self.scheduler.cancel(self.cancelled_jobs.value):
+            self.finish(job_id, start, start, [], None)
+
+    def finish(self, job_id, start, i, sums, error):
+        job = self.jobs[job_id]
+        job.finish(start, i, sums, error)
+        if not job.finished():
+            return
+        del self.jobs[job_id]
+        name = self.names.pop(job_id)
+        elapsed = time.time() - self.started.pop(job_id)
+        key = self.keys.pop(job_id, None)
+        target = self.targets.pop(job_id, {})
+        if isinstance(job, self.stage.DigitsJob):
+            if job.cancelled:
+                emit("cancelled", name, i=job.received)
+            else:
+                emit("done", name, digits=job.digits, elapsed=elapsed)
+        elif job.cancelled:
+            emit("cancelled", name, i=job.completed(), pi=job.pi())
+        else:
+            if target:
+                target["met"] = job.met()
+            emit("done", name, pi=job.pi(), error=job.error(), elapsed=elapsed, **target)
+            if self.store is not None:
+                mode, iterations = key
+                self.store.record(mode, iterations, job.pi(), job.error(), elapsed)
+
+    def handle(self, record):
+        job_id = record.job_id
+        if record.kind == protocol.PROGRESS:
+            job = self.jobs[job_id]
+            job.update(record.start, record.i, record.value)
+            if isinstance(job, self.stage.DigitsJob):
+                emit("progress", self.names[job_id], terms=job.terms_done, of=job.terms)
+            else:
+                emit("progress", self.names[job_id], i=job.completed(), pi=job.pi())
+        elif record.kind == protocol.DIGITS:
+            self.jobs[job_id].add(record.payload)
+            emit("digits", self.names[job_id], text=record.payload)
+        else:
+            self.scheduler.task_done()
+            self.finish(job_id, record.start, record.i, record.payload, record.error)
+
+    def run(self):
+        """
+        Wait for every submitted job to finish.
+        """
+        self.dispatch()
+        while self.jobs:
+            try:
+                select.select([self.doorbell.fileno()], [], [])
+            except KeyboardInterrupt:
+                self.cancel()
+                continue
+            except select.error:
+                continue  # Interrupted by a signal
+            for batch in notify.drain(self.out_queue, self.doorbell.answer()):
+                for record in protocol.unpack(batch):
+                    self.handle(record)
+            self.dispatch()
+
+    def close(self):
+        workers.shutdown(self.exit_flag, self.in_queue, self.workers)
+        self.doorbell.close()
+        if self.store is not None:
+            self.store.close()
+
+
+def main(stage, argv):
+    """
+    Run jobs on ``stage``'s workers (the run.py module) and return the exit
+    status.
+    """
+    parser = argparse.ArgumentParser(prog="run.py --headless",
+                                     description="Compute pi without a GUI.")
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--iterations", type=int, help="number of series terms")
+    parser.add_argument("--tolerance", type=float, metavar="ERROR",
+                        help="use as many terms as it takes to get within ERROR of pi")
+    parser.add_argument("--places", type=int, metavar="N",
+                        help="use as many terms as it takes to get pi to N decimal places")
+    parser.add_argument("--mode", choices=series.MODES, default=series.PLAIN,
+                        help="series mode (default: plain)")
+    parser.add_argument("--digits", type=int, help="work out this many digits instead")
+    parser.add_argument("--backend", choices=BACKENDS, default="process",
+                        help="run the workers as processes or threads (default: process)")
+    parser.add_argument("--workers", type=int, default=stage.WORKERS,
+                        help="number of workers (default: {0})".format(stage.WORKERS))
+    parser.add_argument("--stdin", action="store_true",
+                        help="read JSON job specs from stdin, one per line")
+    parser.add_argument("--fresh", action="store_true",
+                        help="don't answer jobs from the result store")
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="work for the cluster coordinator at HOST:PORT")
+    parser.add_argument("--authkey", help="the coordinator's shared secret "
+                        "(default: $PICALC_AUTHKEY)")
+    args = parser.parse_args(argv)
+
+    if args.connect:
+        from picalc import cluster
+        node = cluster.Node(stage, args.backend, max(1, args.workers),
+                            cluster.parse_address(args.connect),
+                            args.authkey or cluster.default_authkey())
+        try:
+            node.run()
+        finally:
+            node.close()
+        return 0
+
+    if args.stdin:
+        specs = list(read_specs(sys.stdin))
+    elif args.digits is not None:
+        specs = [{"digits": args.digits}]
+    else:
+        spec = {"mode": args.mode}
+        if args.iterations is not None:
+            spec["iterations"] = args.iterations
+        if args.tolerance is not None:
+            spec["tolerance"] = args.tolerance
+        if args.places is not None:
+            spec["places"] = args.places
+        specs = [spec]
+
+    batch = Batch(stage, args.backend, max(1, args.workers),
+                  None if args.fresh else results.ResultStore())
+    try:
+        for spec in specs:
+            batch.submit(spec)
+        batch.run()
+    finally:
+        batch.close()
+    return 0
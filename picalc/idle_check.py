@@ -0,0 +1,61 @@
+"""
+Measure what the stage 9 and 10 workers cost while they sit idle, and how
+long it takes to shut them down the way closeEvent does.
+
+    python -m picalc.idle_check [seconds]
+
+Only the workers are started; no window is opened.
+"""
+import multiprocessing
+import os
+import Queue
+import sys
+import threading
+import time
+
+from picalc import cancel, notify, workers
+from picalc.stages import load_stage
+
+
+def cpu_time():
+    """
+    Return the user + system CPU seconds used by this process and any
+    children that have been joined.
+    """
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def check(name, exit_flag, in_queue, worker_list, seconds):
+    for worker in worker_list:
+        worker.start()
+    time.sleep(0.5)  # Let the workers get to their blocking get()
+    cpu_started = cpu_time()
+    time.sleep(seconds)
+    elapsed = workers.shutdown(exit_flag, in_queue, worker_list)
+    cpu = cpu_time() - cpu_started
+    print "{0}: {1} worker(s), {2:.1f}% of a core while idle, shut down in {3:.1f} ms".format(
+        name, len(worker_list), cpu / seconds * 100.0, elapsed * 1000.0)
+
+
+def main(seconds=5.0):
+    stage9 = load_stage("9_pi_pythreads")
+    exit_flag = threading.Event()
+    in_queue = Queue.Queue()
+    doorbell = notify.Doorbell()
+    check("9_pi_pythreads", exit_flag, in_queue,
+          [stage9.GregoryLeibniz(exit_flag, cancel.Watermark(), in_queue, Queue.Queue(), doorbell)
+           for n in xrange(stage9.WORKERS)], seconds)
+
+    stage10 = load_stage("10_pi_multiprocessing")
+    exit_flag = multiprocessing.Event()
+    in_queue = multiprocessing.Queue()
+    out_queue = multiprocessing.Queue()
+    cancelled_jobs = multiprocessing.Value("l", -1)
+    processes = [multiprocessing.Process(target=stage10.gl_process, args=(exit_flag, cancelled_jobs, in_queue, out_queue, doorbell))
+                 for n in xrange(stage10.WORKERS)]
+    check("10_pi_multiprocessing", exit_flag, in_queue, processes, seconds)
+
+
+if __name__ == "__main__":
+    main(*[float(arg) for arg in sys.argv[1:]])
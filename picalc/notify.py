@@ -0,0 +1,83 @@
+"""
+Waking the GUI up when a worker has sent it something.
+
+Instead of polling the out_queue on a QTimer, workers ring a Doorbell
+after every message they put on it.  The doorbell is a pipe with one byte
+per message, and the GUI watches its read end with a QSocketNotifier, so
+check_gl_out_queue only runs when there is something to read.  An idle
+GUI never wakes up for it.
+
+A multiprocessing.Queue hands messages to a feeder thread, so a message
+can still be on its way when its byte arrives.  That's why the GUI takes
+exactly as many messages as it read bytes, and waits briefly for each one
+(see drain()).
+
+Pipes and QSocketNotifier on pipes are Unix only.
+"""
+import errno
+import fcntl
+import logging
+import os
+import Queue
+
+from picalc import trace
+
+#: Longest the GUI waits for a message whose doorbell byte has arrived
+DELIVERY_TIMEOUT = 1.0
+
+
+class Doorbell(object):
+    """
+    A pipe with a byte written to it for every message.  Create it before
+    starting worker processes so they inherit it.
+    """
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        flags = fcntl.fcntl(self.read_fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.read_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # The write end blocks, so a worker that gets a whole pipe buffer of
+        # messages ahead of the GUI waits for it rather than losing a byte.
+
+    def fileno(self):
+        """
+        The file descriptor to hand to a QSocketNotifier.
+        """
+        return self.read_fd
+
+    def ring(self):
+        os.write(self.write_fd, "!")
+
+    def answer(self):
+        """
+        Read every byte waiting in the pipe and return how many there were.
+        """
+        count = 0
+        while True:
+            try:
+                data = os.read(self.read_fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return count
+                raise
+            if not data:
+                return count
+            count += len(data)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def drain(queue, count):
+    """
+    Generate ``count`` messages from queue, waiting up to DELIVERY_TIMEOUT
+    for each one to arrive.
+    """
+    for n in xrange(count):
+        try:
+            with trace.span("queue get", "queue"):
+                message = queue.get(timeout=DELIVERY_TIMEOUT)
+        except Queue.Empty:
+            logging.warning("%d messages rung for never arrived", count - n)
+            return
+        yield message
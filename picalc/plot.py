@@ -0,0 +1,156 @@
+"""
+Live convergence plot for the pi stages.
+
+The top half shows the partial sum and the bottom half log10 of its
+distance from pi, both against the number of terms on a log axis.
+
+Samples go into a preallocated ring buffer, which costs next to nothing
+per sample.  Whenever the ring fills up, and before every paint, it is
+folded into COLUMNS columns, keeping only the smallest and largest value
+seen in each one.  So memory and paint time are the same for a job of
+10**3 terms as for one of 10**10, and no sample is dropped: a column's
+vertical line covers every sample that landed in it.
+
+Adding a sample never paints.  It starts a single-shot timer, so the plot
+is repainted at most once every REFRESH ms, however fast samples arrive.
+"""
+import math
+
+import numpy
+from PySide import QtGui, QtCore
+
+from picalc import trace
+
+#: Columns across the plot.  At most one per pixel, on most screens.
+COLUMNS = 1024
+
+#: Samples held in the ring buffer between folds
+RING = 4096
+
+#: Least time between repaints, in ms (about one display refresh)
+REFRESH = 16
+
+#: Errors smaller than this are plotted as this
+TINY = 1e-17
+
+
+class Decimator(object):
+    """
+    Min/max per log-spaced column of every (i, pi) sample added since the
+    last reset().
+    """
+    def __init__(self, columns=COLUMNS, ring=RING):
+        self.columns = columns
+        self.ring_i = numpy.zeros(ring)
+        self.ring_pi = numpy.zeros(ring)
+        self.count = 0
+        self.pi_min = numpy.empty(columns)
+        self.pi_max = numpy.empty(columns)
+        self.error_min = numpy.empty(columns)
+        self.error_max = numpy.empty(columns)
+        self.reset(1)
+
+    def reset(self, iterations):
+        self.scale = self.columns / math.log(max(iterations, 2))
+        self.count = 0
+        for lows, highs in ((self.pi_min, self.pi_max), (self.error_min, self.error_max)):
+            lows.fill(numpy.inf)
+            highs.fill(-numpy.inf)
+
+    def add(self, i, pi):
+        if i < 1:
+            return  # Nowhere on a log axis
+        self.ring_i[self.count] = i
+        self.ring_pi[self.count] = pi
+        self.count += 1
+        if self.count == len(self.ring_i):
+            self.fold()
+
+    def fold(self):
+        """
+        Move the samples in the ring into the columns.
+        """
+        if not self.count:
+            return
+        i = self.ring_i[:self.count]
+        pi = self.ring_pi[:self.count]
+        column = numpy.minimum((numpy.log(i) * self.scale).astype(int), self.columns - 1)
+        error = numpy.abs(pi - numpy.pi)
+        numpy.minimum.at(self.pi_min, column, pi)
+        numpy.maximum.at(self.pi_max, column, pi)
+        numpy.minimum.at(self.error_min, column, error)
+        numpy.maximum.at(self.error_max, column, error)
+        self.count = 0
+
+    def filled(self):
+        """
+        Return the indices of the columns that have samples in them.
+        """
+        self.fold()
+        return numpy.flatnonzero(self.pi_min <= self.pi_max)
+
+
+class ConvergencePlot(QtGui.QWidget):
+    """
+    Plots the progress of one job at a time, the one given to start().
+    """
+    def __init__(self, parent=None):
+        super(ConvergencePlot, self).__init__(parent)
+        self.setMinimumHeight(160)
+        self.decimator = Decimator()
+        self.job_id = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.update)
+
+    def start(self, job_id, iterations):
+        self.job_id = job_id
+        self.decimator.reset(iterations)
+        self.schedule()
+
+    def add(self, i, pi):
+        self.decimator.add(i, pi)
+        self.schedule()
+
+    def schedule(self):
+        if not self.timer.isActive():
+            self.timer.start(REFRESH)
+
+    @trace.traced("paint plot", "paint")
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        filled = self.decimator.filled()
+        if len(filled):
+            d = self.decimator
+            x = (filled + 0.5) * (float(self.width()) / d.columns)
+            half = self.height() // 2
+            self.draw_panel(painter, "partial sum", x, d.pi_min[filled], d.pi_max[filled],
+                            0, half)
+            self.draw_panel(painter, "log10 |error|", x,
+                            numpy.log10(numpy.maximum(d.error_min[filled], TINY)),
+                            numpy.log10(numpy.maximum(d.error_max[filled], TINY)),
+                            half, self.height() - half)
+        painter.end()
+
+    def draw_panel(self, painter, title, x, lows, highs, top, height):
+        """
+        Draw a vertical line from low to high in every column, and join the
+        columns up through their middles.
+        """
+        bottom_value = lows.min()
+        span = (highs.max() - bottom_value) or 1.0
+        margin = 4
+        scale = (height - 2 * margin) / span
+        def to_y(values):
+            return top + height - margin - (values - bottom_value) * scale
+        y_low = to_y(lows)
+        y_high = to_y(highs)
+        y_middle = (y_low + y_high) / 2.0
+        painter.setPen(self.palette().color(QtGui.QPalette.Highlight))
+        painter.drawLines([QtCore.QLineF(a, b, a, c) for a, b, c in zip(x, y_low, y_high)])
+        painter.drawPolyline(QtGui.QPolygonF([QtCore.QPointF(a, b) for a, b in zip(x, y_middle)]))
+        painter.setPen(self.palette().color(QtGui.QPalette.Text))
+        painter.drawText(QtCore.QRectF(margin, top + margin, self.width() - 2 * margin, height),
+                         QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop,
+                         "{0} {1:.6g} .. {2:.6g}".format(title, bottom_value, highs.max()))
@@ -0,0 +1,192 @@
+"""
+Binary messages from the queue-fed workers back to the GUI.
+
+The out_queue used to carry tuples tagged with strings, such as
+("progress", 42.0) and ("status", "i=... pi=..."), and every one had to be
+pickled on its own.  Now every message is a fixed-size Record, packed with
+struct.  Records are written into a batch, and a whole batch goes through
+the queue as one string, with a single ring of the doorbell.
+
+A Record has a 48 byte header:
+
+    kind     PROGRESS, DONE, CANCELLED or DIGITS
+    count    length of the payload after the header
+    job_id
+    start    start of the sub-range, for stage 10, or 0
+    i        next term to be summed, or the digit count
+    value    pi so far, the number of terms for a digits job's progress, or
+             for stage 10's DONE, the seconds a plain series sub-range took
+    error    error estimate, NaN if there isn't one
+
+DONE and CANCELLED can carry block sums as a payload of ``count`` doubles,
+and DIGITS carries ``count`` bytes of digit text.  Nothing is formatted
+for display until the GUI shows it.
+
+A Writer only keeps the newest PROGRESS record for each sub-range, and
+flush_due() only sends a batch every ``interval`` seconds, so progress and
+digits collect in between.  Workers flush() as soon as a sub-range is done
+or cancelled, since that's what the GUI waits on, and that record
+replaces its sub-range's progress.
+
+The out_queue is bounded, to QUEUE_SIZE batches, so a worker that gets
+ahead of the GUI can't pile up memory without limit.  What a Writer does
+when the queue is full is its ``overflow`` policy.  With DROP_PROGRESS,
+PROGRESS records are dropped, since the next one or the DONE supersedes
+them, and anything else waits for room.  With BLOCK, everything waits.
+Only progress is ever lost: DONE, CANCELLED and DIGITS always get there,
+unless the workers are being shut down.
+"""
+import array
+import collections
+import math
+import struct
+import time
+
+try:
+    import Queue
+except ImportError:
+    import queue as Queue  # Python 3
+
+from picalc import throttle, trace
+
+PROGRESS = 1
+DONE = 2
+CANCELLED = 3
+DIGITS = 4
+
+HEADER = struct.Struct("<BxxxIqqqdd")
+
+NAN = float("nan")
+
+#: Most batches an out_queue holds.  Make it with Queue.Queue(QUEUE_SIZE)
+#: or multiprocessing.Queue(QUEUE_SIZE).
+QUEUE_SIZE = 64
+
+#: What Writer.flush() does when out_queue is full
+BLOCK = "block"
+DROP_PROGRESS = "drop progress"
+
+#: Seconds between looks at the exit flag while waiting for room
+PUT_TIMEOUT = 0.1
+
+Record = collections.namedtuple("Record", "kind job_id start i value error payload")
+
+
+def to_bytes(doubles):
+    """
+    Return the bytes of an array, with tobytes() where there is one, since
+    tostring() is gone in Python 3.9.
+    """
+    if hasattr(doubles, "tobytes"):
+        return doubles.tobytes()
+    return doubles.tostring()
+
+
+def pack(kind, job_id, start=0, i=0, value=0.0, error=None, payload=None):
+    """
+    Return one record as a string.  ``payload`` is a list of floats for
+    DONE and CANCELLED, or a string for DIGITS.
+    """
+    if error is None:
+        error = NAN
+    if payload is None:
+        data = b""
+        count = 0
+    elif kind == DIGITS:
+        data = payload
+        count = len(data)
+    else:
+        data = to_bytes(array.array("d", payload))
+        count = len(payload)
+    return HEADER.pack(kind, count, job_id, start, i, value, error) + data
+
+
+def unpack(batch):
+    """
+    Generate the Records in a batch.
+    """
+    offset = 0
+    while offset < len(batch):
+        kind, count, job_id, start, i, value, error = HEADER.unpack_from(batch, offset)
+        offset += HEADER.size
+        if kind == DIGITS:
+            payload = batch[offset:offset + count]
+            offset += count
+        else:
+            payload = array.array("d", batch[offset:offset + 8 * count]).tolist()
+            offset += 8 * count
+        if math.isnan(error):
+            error = None
+        yield Record(kind, job_id, start, i, value, error, payload)
+
+
+class Writer(object):
+    """
+    Collects records and sends them down out_queue a batch at a time.
+
+    flush() sends whatever there is straight away.  flush_due() holds it
+    back until ``interval`` seconds after the last batch.
+
+    If given, ``exit_flag`` is watched while waiting for room in the queue,
+    so a worker the GUI has stopped reading from can still shut down.
+    """
+    def __init__(self, out_queue, doorbell, overflow=DROP_PROGRESS, exit_flag=None,
+                 interval=throttle.INTERVAL):
+        self.out_queue = out_queue
+        self.doorbell = doorbell
+        self.overflow = overflow
+        self.exit_flag = exit_flag
+        self.interval = interval
+        self.progress = collections.OrderedDict()  # (job_id, start) -> packed PROGRESS record
+        self.records = []  # (kind, packed record), for everything else
+        self.next_send = 0.0
+
+    def add(self, kind, job_id, start=0, *args, **kwargs):
+        data = pack(kind, job_id, start, *args, **kwargs)
+        if kind == PROGRESS:
+            self.progress[job_id, start] = data
+            return
+        if kind in (DONE, CANCELLED):
+            self.progress.pop((job_id, start), None)
+        self.records.append((kind, data))
+
+    def flush_due(self):
+        """
+        Send the batch if ``interval`` seconds have gone by since the last
+        one.
+        """
+        if (self.progress or self.records) and time.time() >= self.next_send:
+            self.flush()
+
+    def flush(self):
+        if not self.progress and not self.records:
+            return
+        # Progress goes first, since it can't come after its sub-range's DONE
+        records = [(PROGRESS, data) for data in self.progress.values()] + self.records
+        self.progress.clear()
+        self.records = []
+        self.next_send = time.time() + self.interval
+        with trace.span("queue put", "queue", records=len(records)):
+            try:
+                self.out_queue.put_nowait(b"".join(data for kind, data in records))
+            except Queue.Full:
+                if self.overflow == DROP_PROGRESS:
+                    kept = [data for kind, data in records if kind != PROGRESS]
+                else:
+                    kept = [data for kind, data in records]
+                if not kept or not self.wait_put(b"".join(kept)):
+                    return
+            self.doorbell.ring()
+
+    def wait_put(self, batch):
+        """
+        Wait for room for batch in out_queue and put it there.  Returns
+        False if the exit flag got set first.
+        """
+        while True:
+            try:
+                self.out_queue.put(batch, timeout=PUT_TIMEOUT)
+                return True
+            except Queue.Full:
+                if self.exit_flag is not None and self.exit_flag.is_set():
+                    return False
@@ -0,0 +1,99 @@
+"""
+On-disk store of finished pi results, kept across restarts.
+
+Every job that runs to the end is recorded in a small SQLite database as
+(algorithm, iterations, value, error, elapsed), keyed on algorithm and
+iterations.  Before a stage starts a worker it asks the store, and if the
+same job has been done before, the answer is shown straight away.
+
+The database is only opened the first time it's used, so it costs nothing
+at startup.  Once the file grows past ``max_bytes``, the least recently
+used half of the results is deleted and the file is vacuumed.
+
+The store is meant to be used from the GUI thread only.  It lives in
+~/.picalc/results.sqlite unless PICALC_RESULTS says otherwise.
+"""
+import os
+import sqlite3
+import time
+
+#: Compact the database once it gets bigger than this many bytes
+MAX_BYTES = 4 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    algorithm TEXT NOT NULL,
+    iterations INTEGER NOT NULL,
+    value REAL NOT NULL,
+    error REAL NOT NULL,
+    elapsed REAL NOT NULL,
+    recorded REAL NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (algorithm, iterations)
+)
+"""
+
+
+def default_path():
+    path = os.environ.get("PICALC_RESULTS")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".picalc", "results.sqlite")
+
+
+class ResultStore(object):
+    def __init__(self, path=None, max_bytes=MAX_BYTES):
+        self.path = path or default_path()
+        self.max_bytes = max_bytes
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute(_SCHEMA)
+        return self._db
+
+    def lookup(self, algorithm, iterations):
+        """
+        Return (value, error, elapsed) for a result that has been recorded
+        before, or None.
+        """
+        row = self.db.execute(
+            "SELECT value, error, elapsed FROM results WHERE algorithm = ? AND iterations = ?",
+            (algorithm, iterations)).fetchone()
+        if row is not None:
+            with self.db:
+                self.db.execute(
+                    "UPDATE results SET used = ? WHERE algorithm = ? AND iterations = ?",
+                    (time.time(), algorithm, iterations))
+        return row
+
+    def record(self, algorithm, iterations, value, error, elapsed):
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (algorithm, iterations, value, error, elapsed, now, now))
+        if os.path.getsize(self.path) > self.max_bytes:
+            self.compact()
+
+    def compact(self):
+        """
+        Delete the least recently used half of the results and give the
+        space back to the file system.
+        """
+        with self.db:
+            count = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            self.db.execute(
+                "DELETE FROM results WHERE rowid IN "
+                "(SELECT rowid FROM results ORDER BY used LIMIT ?)", (count // 2,))
+        self.db.execute("VACUUM")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
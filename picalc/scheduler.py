@@ -0,0 +1,71 @@
+"""
+Priority scheduling of pi jobs onto a long-lived set of workers.
+
+Jobs are numbered as in picalc.cancel, and a job can be made of several
+tasks (stage 10 hands the plain series out a sub-range at a time).
+Instead of putting every task straight on the workers' in_queue, where
+they'd run first come first served, the GUI hands them to a Scheduler.
+It holds them back until a worker is free and then gives out the most
+urgent one.  Lower priority numbers go first, and jobs with the same
+priority run in the order they were started.
+
+At most ``concurrency`` tasks are out at once.  With concurrency equal to
+the number of workers, every task handed out is picked up straight away,
+so the in_queue never gets the chance to reorder anything.
+"""
+import heapq
+
+#: Job priorities.  Lower numbers run first.
+URGENT = 0
+NORMAL = 1
+
+
+class Scheduler(object):
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.pending = []
+        self.running = 0
+        self._sequence = 0  # Keeps a job's tasks in the order they were given
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, job_id, priority, tasks):
+        for task in tasks:
+            heapq.heappush(self.pending, (priority, job_id, self._sequence, task))
+            self._sequence += 1
+
+    def ready(self, cut=None):
+        """
+        Return the tasks that can be handed out now, most urgent first.
+        They count as running until task_done() is called for each.
+
+        If given, ``cut(task)`` returns (piece, rest), for handing a task
+        out a piece at a time.  The rest, unless it's None, keeps the
+        task's place in line.
+        """
+        tasks = []
+        while self.pending and self.running < self.concurrency:
+            priority, job_id, sequence, task = heapq.heappop(self.pending)
+            if cut is not None:
+                task, rest = cut(task)
+                if rest is not None:
+                    heapq.heappush(self.pending, (priority, job_id, sequence, rest))
+            tasks.append(task)
+            self.running += 1
+        return tasks
+
+    def task_done(self):
+        self.running -= 1
+
+    def cancel(self, watermark):
+        """
+        Drop the pending tasks of every job numbered up to ``watermark``,
+        and return them as a list of (job_id, task).
+        """
+        dropped = [(job_id, task) for priority, job_id, sequence, task in self.pending
+                   if job_id <= watermark]
+        if dropped:
+            self.pending = [entry for entry in self.pending if entry[1] > watermark]
+            heapq.heapify(self.pending)
+        return dropped
@@ -0,0 +1,281 @@
+"""
+Ways of summing the Gregory-Leibniz series.
+
+The plain series needs about 10**n terms for n digits.  The other modes
+squeeze far more out of each term:
+
+pairs
+    Adds the terms two at a time, 4/(4k+1) - 4/(4k+3) = 8/((4k+1)(4k+3)),
+    so every term added is positive and nothing cancels.  It converges no
+    faster than the plain series, but loses less to rounding.
+euler
+    Euler-van Wijngaarden transform: the partial sums S_0..S_n are
+    averaged pairwise, over and over, which cancels the alternating error.
+    Each round gains about a bit, so 64 terms is plenty for a double.
+richardson
+    Richardson extrapolation on the partial sums S_2, S_4, ..., S_2**k.
+    For even N the error of S_N only has odd powers of 1/N
+    (1/N - 1/(4N**3) + ...), and each column of the table removes the next
+    one.
+
+Every mode returns (pi, error), where error is an estimate of how far pi
+is from the real thing.  terms_for() turns that around, and works out how
+many terms a mode needs to get within a given error, as far as it can.
+"""
+import math
+
+import numpy
+
+from picalc import kernel, trace
+
+PLAIN = "plain"
+PAIRS = "pairs"
+EULER = "euler"
+RICHARDSON = "richardson"
+
+#: Modes, in the order they're offered in the menus
+MODES = [PLAIN, PAIRS, EULER, RICHARDSON]
+
+#: Menu text for each mode
+NAMES = {
+    PLAIN: "&Plain series",
+    PAIRS: "P&airwise terms",
+    EULER: "&Euler transform",
+    RICHARDSON: "&Richardson extrapolation",
+}
+
+#: Number of terms each mode uses when Start is clicked
+TERMS = {
+    PLAIN: 10 ** 9,
+    PAIRS: 10 ** 9,
+    EULER: 64,
+    RICHARDSON: 256,
+}
+
+#: Most terms terms_for() gives the plain and pairwise series, several
+#: minutes' work for one core.  They'd need 10**15 or so to get down to
+#: rounding error.
+MAX_TERMS = 10 ** 11
+
+#: Most terms the accelerated modes use.  They're down to rounding error
+#: long before this, and past it the rounding in partial_sums() only grows
+#: (and Euler's time with the square of the terms).
+MAX_ACCELERATED = 1 << 12
+
+#: The accelerated modes can't promise better than a few ulps of pi,
+#: however closely their last two estimates agree.
+_ROUNDING = 8.0 * numpy.spacing(numpy.pi)
+
+
+def _rounding(iterations):
+    """
+    Rounding error to allow for in an accelerated estimate built from
+    ``iterations`` partial sums.  The cumulative sum picks up about an ulp
+    per term in a random walk, so it grows like the square root of the
+    terms, and it's never less than _ROUNDING.
+    """
+    return max(_ROUNDING, math.sqrt(iterations) * numpy.spacing(numpy.pi))
+
+
+def error_bound(iterations):
+    """
+    Alternating series bound for the first ``iterations`` terms: the error
+    is smaller than the first term left out.
+    """
+    return 4.0 / (2.0 * iterations + 1.0)
+
+
+def tolerance_for(places):
+    """
+    Return the error that makes pi good to ``places`` decimal places.
+    """
+    return 0.5 * 10.0 ** -places
+
+
+def terms_for(mode, tolerance):
+    """
+    Return how many terms ``mode`` needs for its error to be no more than
+    ``tolerance``.
+
+    For the plain and pairwise series that's the fewest terms whose
+    error_bound() is small enough, up to MAX_TERMS.  The accelerated modes
+    are tried on 2, 4, 8, ... terms, stopping at the first whose estimate
+    is, or whose estimate is down to rounding error, which more terms only
+    make worse.  If none of them get there, the one with the smallest
+    estimate is returned.  No mode is asked for better than _ROUNDING.  So
+    the error a job ends up with can be more than ``tolerance``, and the
+    caller has to check it.
+    """
+    if not tolerance >= 0.0:
+        raise ValueError("tolerance can't be negative")
+    tolerance = max(tolerance, _ROUNDING)
+    if mode in (PLAIN, PAIRS):
+        iterations = max(1, int(math.ceil((4.0 / tolerance - 1.0) / 2.0)))
+        while error_bound(iterations) > tolerance:
+            iterations += 1  # Rounding in the division
+        iterations = min(iterations, MAX_TERMS)
+        if mode == PAIRS:
+            iterations += iterations % 2  # Only whole pairs get summed
+        return iterations
+    best = None  # (error, iterations)
+    iterations = 2
+    while iterations <= MAX_ACCELERATED:
+        error = accelerated(mode, iterations)[1]
+        if best is None or error < best[0]:
+            best = (error, iterations)
+        if error <= tolerance or error <= _rounding(iterations):
+            break
+        iterations *= 2
+    return best[1]
+
+
+def missed(error, tolerance):
+    """
+    Return ", target ... not met", to go after "pi=... +/- error" in a
+    status message, if there's a tolerance and error is more.  Otherwise
+    return "".
+    """
+    if tolerance is None or error <= tolerance:
+        return ""
+    return ", target {0:.1e} not met".format(tolerance)
+
+
+def evaluate(mode, iterations, progress=None, cancel=None, checkpoints=None, sizer=None):
+    """
+    Sum ``iterations`` terms using ``mode`` and return (pi, error).
+
+    ``progress`` and ``cancel`` work the same as for
+    kernel.gregory_leibniz().  The accelerated modes only use a few hundred
+    terms, so they report progress once, at the end.  If ``checkpoints``
+    (a checkpoints.CheckpointCache) is given, the plain series picks up
+    from the nearest checkpoint instead of starting over.  If ``sizer`` (a
+    chunking.ChunkSizer) is given, the plain series reports progress and
+    checks cancel once per chunk instead of once per block.
+    """
+    if mode == PLAIN:
+        if checkpoints is not None:
+            return (checkpoints.gregory_leibniz(iterations, progress, cancel, sizer),
+                    error_bound(iterations))
+        chunks = sizer.chunks(iterations) if sizer is not None else None
+        return (kernel.gregory_leibniz(iterations, progress, cancel=cancel, chunks=chunks),
+                error_bound(iterations))
+    if mode == PAIRS:
+        return pairs(iterations, progress, cancel)
+    pi, error = accelerated(mode, iterations, cancel)
+    if progress is not None:
+        progress(iterations, pi)
+    return pi, error
+
+
+def accelerated(mode, iterations, cancel=None):
+    """
+    Return (pi, error) for one of the modes that only use a few hundred
+    terms, which are worked out in one go.  No more than MAX_ACCELERATED
+    terms are used, however many are asked for.
+    """
+    if cancel is not None and cancel.is_set():
+        raise kernel.Cancelled(0, 0.0)
+    iterations = min(iterations, MAX_ACCELERATED)
+    with trace.span("chunk", "kernel", start=0, stop=iterations):
+        if mode == EULER:
+            return euler(iterations)
+        if mode == RICHARDSON:
+            return richardson(iterations)
+    raise ValueError("Unknown series mode {0!r}".format(mode))
+
+
+def steps(mode, iterations, cancel=None):
+    """
+    Generate (i, pi, error) as ``iterations`` terms are summed using
+    ``mode``, after every block, so the caller can stop in between and
+    carry on later.  The last one is what evaluate() would return, and
+    there always is one, even with no terms to sum.  ``cancel`` is checked
+    before every block.
+    """
+    if mode in (PLAIN, PAIRS):
+        if mode == PLAIN:
+            sums = kernel.partial_sums(iterations, cancel=cancel)
+        else:
+            sums = pair_sums(iterations, cancel)
+        i = None
+        for i, pi in sums:
+            yield i, pi, error_bound(i)
+        if i is None:
+            yield 0, 0.0, error_bound(0)
+    else:
+        pi, error = accelerated(mode, iterations, cancel)
+        yield iterations, pi, error
+
+
+def partial_sums(iterations):
+    """
+    Return the array S_0..S_iterations, where S_n is the sum of the first
+    n terms.
+    """
+    k = numpy.arange(iterations, dtype=numpy.float64)
+    terms = (4.0 - 8.0 * (k % 2)) / (2.0 * k + 1.0)
+    return numpy.concatenate(([0.0], numpy.cumsum(terms)))
+
+
+def pairs(iterations, progress=None, cancel=None):
+    """
+    Sum the first ``iterations`` terms (rounded down to even) in pairs.
+    """
+    total = 0.0
+    for i, total in pair_sums(iterations, cancel):
+        if progress is not None:
+            progress(i, total)
+    return total, error_bound(2 * (iterations // 2))
+
+
+def pair_sums(iterations, cancel=None):
+    """
+    Generate (i, pi) after every block of pairs, where i is the number of
+    terms summed so far.
+    """
+    count = iterations // 2
+    total = 0.0
+    for lo, hi in kernel.block_bounds(count):
+        if cancel is not None and cancel.is_set():
+            raise kernel.Cancelled(2 * lo, total)
+        with trace.span("chunk", "kernel", start=2 * lo, stop=2 * hi):
+            k = numpy.arange(lo, hi, dtype=numpy.float64)
+            total += float((8.0 / ((4.0 * k + 1.0) * (4.0 * k + 3.0))).sum())
+        yield 2 * hi, total
+
+
+def euler(iterations):
+    """
+    Euler-van Wijngaarden transform of the first ``iterations`` terms.
+    """
+    sums = partial_sums(iterations)
+    if iterations < 2:
+        return float(sums[-1]), error_bound(iterations)
+    while len(sums) > 1:
+        previous = sums[-1]
+        sums = 0.5 * (sums[:-1] + sums[1:])
+    pi = float(sums[0])
+    return pi, max(abs(pi - previous), _rounding(iterations))
+
+
+def richardson(iterations):
+    """
+    Richardson extrapolation over S_2, S_4, ..., S_N, where N is the
+    largest power of two no more than ``iterations``.
+    """
+    sums = partial_sums(iterations)
+    table = []
+    n = 2
+    while n <= iterations:
+        row = [float(sums[n])]
+        for m, previous in enumerate(table[-1] if table else [], 1):
+            factor = 2.0 ** (2 * m - 1) - 1.0
+            row.append(row[-1] + (row[-1] - previous) / factor)
+        table.append(row)
+        n *= 2
+    if not table:
+        return float(sums[-1]), error_bound(iterations)
+    if len(table) == 1:
+        return table[0][0], error_bound(2)
+    pi = table[-1][-1]
+    return pi, max(abs(pi - table[-1][-2]), _rounding(iterations))
@@ -0,0 +1,78 @@
+"""
+Shared memory progress board for worker processes.
+
+Sending every progress update through a multiprocessing.Queue costs a
+pickle, a feeder thread hand-off, a pipe write and an unpickle.  A
+ProgressBoard is instead a fixed array of ctypes structs in shared memory,
+one slot per worker.  A worker overwrites its slot in place as it goes,
+and the GUI reads the slots whenever it wants to redraw.  Only control
+messages (done, cancelled, digits) still need the queue.
+
+Each slot is guarded by a sequence number, like a seqlock.  The worker
+makes it odd while it writes and even again when it's done, and a reader
+that sees it odd or changed reads again, up to READ_TRIES times.  A worker
+that died halfway through a post leaves its slot odd for good, so after
+that the reader settles for the last consistent value it got from the
+slot.  The board has to be created before the worker processes are
+started, so they inherit it.
+"""
+import ctypes
+import multiprocessing
+
+#: Reads of a slot before read() gives up on getting a fresh value
+READ_TRIES = 256
+
+
+class Slot(ctypes.Structure):
+    _fields_ = [
+        ("sequence", ctypes.c_uint64),
+        ("job_id", ctypes.c_int64),
+        ("start", ctypes.c_int64),
+        ("i", ctypes.c_int64),
+        ("pi", ctypes.c_double),
+    ]
+
+
+class ProgressBoard(object):
+    """
+    One Slot per worker, holding the (job_id, start, i, pi) of the last
+    progress that worker posted.
+    """
+    def __init__(self, slots):
+        self.slots = multiprocessing.RawArray(Slot, slots)
+        for slot in self.slots:
+            slot.job_id = -1
+        self.last = [(-1, 0, 0, 0.0)] * slots  # Last consistent read of each slot, reader side
+
+    def __len__(self):
+        return len(self.slots)
+
+    def post(self, slot, job_id, start, i, pi):
+        """
+        Called by the worker that owns ``slot``.
+        """
+        entry = self.slots[slot]
+        entry.sequence += 1
+        entry.job_id = job_id
+        entry.start = start
+        entry.i = i
+        entry.pi = pi
+        entry.sequence += 1
+
+    def read(self, slot):
+        """
+        Return (job_id, start, i, pi) from ``slot``.  job_id is -1 if the
+        slot has never been posted to.  If the worker is in the middle of
+        a post every time it's tried, the last value read is returned
+        again.
+        """
+        entry = self.slots[slot]
+        for attempt in range(READ_TRIES):
+            sequence = entry.sequence
+            if sequence % 2:
+                continue
+            values = (entry.job_id, entry.start, entry.i, entry.pi)
+            if entry.sequence == sequence:
+                self.last[slot] = values
+                return values
+        return self.last[slot]
@@ -0,0 +1,32 @@
+"""
+Loading the pi stages from tools that drive them without a user.
+"""
+import os
+import sys
+
+try:
+    import importlib.util
+    _spec_from_file_location = importlib.util.spec_from_file_location
+except (ImportError, AttributeError):
+    import imp  # Python 2; imp is gone in Python 3.12
+    _spec_from_file_location = None
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+#: Directories of the stages that compute pi, in order
+PI_STAGES = ["7_pi_nothreads", "8_pi_qthreads", "9_pi_pythreads", "10_pi_multiprocessing"]
+
+
+def load_stage(directory):
+    """
+    Import a stage's run.py as a module.
+    """
+    name = "stage_" + directory.split("_")[0]
+    path = os.path.join(_ROOT, directory, "run.py")
+    if _spec_from_file_location is None:
+        return imp.load_source(name, path)
+    spec = _spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # As imp.load_source did
+    spec.loader.exec_module(module)
+    return module
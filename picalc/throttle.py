@@ -0,0 +1,57 @@
+"""
+Rate limiting for worker progress reports.
+
+The kernel calls its progress callback once per block, which is far more
+often than anybody can read a status bar.  Wrapping the real report
+function in a Throttle makes the expensive part (formatting, emitting a
+signal, putting on a queue) happen once per update instead of once per
+block.
+"""
+import time
+
+#: Default minimum number of seconds between reports
+INTERVAL = 0.1
+
+#: Default minimum progress, in percent, between reports
+STEP = 1.0
+
+
+class Throttle(object):
+    """
+    Call ``report(i, pi)`` at most once every ``interval`` seconds, and only
+    after at least ``step`` percent more of start..stop is done.  Pass 0 or
+    None for either one to turn that limit off.
+
+    The last call that was held back is kept, and flush() reports it, so
+    the final value always gets through.
+    """
+    def __init__(self, report, stop, start=0, interval=INTERVAL, step=STEP):
+        self.report = report
+        self.interval = interval
+        self.step_size = (stop - start) * step / 100.0 if step else 0
+        self.next_i = start
+        self.next_time = 0.0
+        self.pending = None
+
+    def __call__(self, i, pi):
+        if i < self.next_i:
+            self.pending = (i, pi)
+            return
+        if self.interval:
+            now = time.time()
+            if now < self.next_time:
+                self.pending = (i, pi)
+                return
+            self.next_time = now + self.interval
+        self.next_i = i + self.step_size
+        self.pending = None
+        self.report(i, pi)
+
+    def flush(self):
+        """
+        Report the last held back (i, pi), if there is one.
+        """
+        if self.pending is not None:
+            i, pi = self.pending
+            self.pending = None
+            self.report(i, pi)
@@ -0,0 +1,203 @@
+"""
+Chrome trace recording, for finding out where the time goes in a run.
+
+While recording, spans are kept for jobs, the chunks the kernel sums,
+queue puts and gets, signal emissions, slots and plot repaints.  save()
+writes them all to one JSON file in Chrome's trace event format, which
+chrome://tracing and Perfetto can open.  Recording is started and stopped
+from Help > Record trace in the pi stages, or for a whole run by setting
+PICALC_TRACE to the file to save it to.
+
+When nothing is being recorded, span() hands back a shared do-nothing
+context manager and traced() functions go straight through, so the cost
+is one look at a shared flag.
+
+Worker processes forked from the process that first imported this module
+share its flag, so recording starts and stops for all of them at once.
+Each process keeps its own events and appends them to a file of its own
+in a temporary directory after every task (see flush()).  save() merges
+those files with the GUI's own events.  Timestamps are wall clock time, so
+they line up across processes.
+"""
+import atexit
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+#: Set while recording, in memory that forked processes share
+_recording = multiprocessing.RawValue("b", 0)
+
+#: When recording last started
+_started = multiprocessing.RawValue("d", 0.0)
+
+#: The process that imported this module first, which saves the trace
+_root = os.getpid()
+
+_directory = os.path.join(tempfile.gettempdir(), "picalc-trace-{0}".format(_root))
+
+#: co_flags bit for a function that takes *args
+_VARARGS = 0x04
+
+_events = []
+_threads = {}  # Thread ident -> name, for the metadata events
+_pid = _root
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record({"name": self.name, "cat": self.category, "ph": "X",
+                 "ts": self.start * 1e6, "dur": (time.time() - self.start) * 1e6,
+                 "args": self.args})
+        return False
+
+
+def recording():
+    return bool(_recording.value)
+
+
+def _record(event):
+    global _events, _threads, _pid
+    pid = os.getpid()
+    if pid != _pid:
+        _events = []  # Forked; the parent's events are its own business
+        _threads = {}
+        _pid = pid
+    thread = threading.current_thread()
+    if thread.ident not in _threads:
+        _threads[thread.ident] = thread.name
+        _events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread.ident,
+                        "args": {"name": thread.name}})
+    event["pid"] = pid
+    event["tid"] = thread.ident
+    _events.append(event)
+
+
+def span(name, category="picalc", **args):
+    """
+    Return a context manager that records the time spent inside it.
+    """
+    if not _recording.value:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def traced(name, category="slot"):
+    """
+    Decorator that records every call to the function as a span.
+
+    Qt sees the wrapper's ``*args`` rather than the function's own
+    arguments, so it hands it every argument the signal has, e.g. the
+    socket of a QSocketNotifier.  Like Qt does for a real slot, the ones
+    past the function's own are dropped.
+    """
+    def decorate(function):
+        code = function.__code__
+        takes = None if code.co_flags & _VARARGS else code.co_argcount
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if takes is not None:
+                args = args[:takes]
+            if not _recording.value:
+                return function(*args, **kwargs)
+            with _Span(name, category, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def begin(name, id, category="job", **args):
+    """
+    Start an asynchronous span, such as a job's life from Start to done.
+    """
+    if _recording.value:
+        _record({"name": name, "cat": category, "ph": "b", "id": id,
+                 "ts": time.time() * 1e6, "args": args})
+
+
+def end(name, id, category="job", **args):
+    if _recording.value:
+        _record({"name": name, "cat": category, "ph": "e", "id": id,
+                 "ts": time.time() * 1e6, "args": args})
+
+
+def start():
+    _started.value = time.time()
+    _recording.value = 1
+
+
+def stop():
+    _recording.value = 0
+
+
+def flush():
+    """
+    Hand this process's events over to the one that saves the trace.  The
+    root process keeps its own.
+    """
+    global _events
+    if not _events or os.getpid() != _pid or _pid == _root:
+        return
+    events, _events = _events, []
+    _threads.clear()
+    if not os.path.isdir(_directory):
+        try:
+            os.makedirs(_directory)
+        except OSError:
+            pass  # Another worker made it first
+    with open(os.path.join(_directory, "{0}.json".format(_pid)), "a") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def save(path):
+    """
+    Write every event recorded since start() to ``path``, and forget them.
+    """
+    global _events
+    events, _events = _events, []
+    for name in glob.glob(os.path.join(_directory, "*.json")):
+        with open(name) as f:
+            events.extend(json.loads(line) for line in f)
+        os.remove(name)
+    if os.path.isdir(_directory):
+        os.rmdir(_directory)
+    _threads.clear()  # So the next trace names them again
+    since = _started.value * 1e6
+    events = [event for event in events if event.get("ts", since) >= since]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+
+def _save_at_exit(path):
+    if os.getpid() == _root:
+        stop()
+        save(path)
+
+if os.environ.get("PICALC_TRACE"):
+    start()
+    atexit.register(_save_at_exit, os.environ["PICALC_TRACE"])
@@ -0,0 +1,151 @@
+"""
+Compare the two ways of getting worker messages to the GUI thread:
+polling the out_queue on a 100 ms QTimer, the way stages 9 and 10 used to,
+and a notify.Doorbell watched by a QSocketNotifier.
+
+    python -m picalc.wakeup_check [messages]
+
+For each, a thread sends timestamped messages at random intervals, and
+the delivery latency is measured.  Before that, the GUI thread's wakeups
+are counted over a second with nothing to deliver.
+
+Then each pi stage's real window is opened and left alone for
+WINDOW_IDLE_TIME, and the context switches of every thread in it and in
+its worker processes are counted, from /proc (so Linux only).  That
+covers everything that wakes an idle window up, timers, watchdog and
+workers included, not just the message path.
+"""
+import glob
+import multiprocessing
+import os
+import Queue
+import random
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide import QtCore, QtGui
+
+from picalc import notify, stages
+
+#: How often the old QTimer path polled, in ms
+POLL_INTERVAL = 100
+
+#: Seconds spent counting wakeups with nothing to deliver
+IDLE_TIME = 1.0
+
+#: Seconds each stage's window is left idle while its wakeups are counted
+WINDOW_IDLE_TIME = 5.0
+
+
+class Receiver(object):
+    """
+    The GUI end of one of the two paths.  With no doorbell it polls.
+    """
+    def __init__(self, app, queue, expected, doorbell=None):
+        self.app = app
+        self.queue = queue
+        self.expected = expected
+        self.doorbell = doorbell
+        self.wakeups = 0
+        self.latencies = []
+        if doorbell is None:
+            self.timer = QtCore.QTimer()
+            self.timer.timeout.connect(self.poll)
+            self.timer.start(POLL_INTERVAL)
+        else:
+            self.notifier = QtCore.QSocketNotifier(doorbell.fileno(), QtCore.QSocketNotifier.Read)
+            self.notifier.activated.connect(self.answer)
+
+    def poll(self):
+        self.wakeups += 1
+        while True:
+            try:
+                sent = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.received(sent)
+
+    def answer(self):
+        self.wakeups += 1
+        for sent in notify.drain(self.queue, self.doorbell.answer()):
+            self.received(sent)
+
+    def received(self, sent):
+        self.latencies.append((time.time() - sent) * 1000.0)
+        if len(self.latencies) == self.expected:
+            self.app.quit()
+
+
+def send(queue, doorbell, count):
+    for n in xrange(count):
+        time.sleep(random.uniform(0.005, 0.05))
+        queue.put(time.time())
+        if doorbell is not None:
+            doorbell.ring()
+
+
+def measure(app, name, doorbell, count):
+    queue = Queue.Queue()
+    receiver = Receiver(app, queue, count, doorbell)
+    QtCore.QTimer.singleShot(int(IDLE_TIME * 1000), app.quit)
+    app.exec_()
+    idle_wakeups = receiver.wakeups / IDLE_TIME
+
+    sender = threading.Thread(target=send, args=(queue, doorbell, count))
+    sender.start()
+    app.exec_()
+    sender.join()
+    latencies = sorted(receiver.latencies)
+    print "{0}: latency mean {1:.2f} ms, max {2:.2f} ms; {3:.1f} idle wakeups/s".format(
+        name, sum(latencies) / len(latencies), latencies[-1], idle_wakeups)
+
+
+def context_switches(pids):
+    """
+    Return the context switches so far of every thread of the processes.
+    """
+    total = 0
+    for pid in pids:
+        for name in glob.glob("/proc/{0}/task/*/status".format(pid)):
+            with open(name) as f:
+                for line in f:
+                    if line.endswith("ctxt_switches:", 0, line.find(":") + 1):
+                        total += int(line.split()[1])
+    return total
+
+
+def run_for(app, seconds):
+    QtCore.QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec_()
+
+
+def measure_window(app, directory):
+    stage = stages.load_stage(directory)
+    os.environ["PICALC_RESULTS"] = os.path.join(tempfile.mkdtemp(), "results.sqlite")
+    window = stage.MainWindow()
+    window.show()
+    run_for(app, 0.5)  # Let it settle
+    pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+    before = context_switches(pids)
+    run_for(app, WINDOW_IDLE_TIME)
+    wakeups = (context_switches(pids) - before) / WINDOW_IDLE_TIME
+    window.close()
+    print "{0} window: {1:.1f} idle wakeups/s".format(directory, wakeups)
+
+
+def main(count=100):
+    app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv[:1])
+    measure(app, "QTimer polling", None, count)
+    doorbell = notify.Doorbell()
+    measure(app, "Doorbell", doorbell, count)
+    doorbell.close()
+    for directory in stages.PI_STAGES:
+        measure_window(app, directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
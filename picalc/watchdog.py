@@ -0,0 +1,193 @@
+"""
+Event loop stall watchdog.
+
+A QTimer on the GUI thread beats every INTERVAL ms, and each beat records
+how late it was in a histogram with power-of-two buckets.  A small
+background thread checks that the beats keep coming.  If the GUI thread
+goes THRESHOLD ms without a beat, the watchdog logs a warning with a
+sample of the GUI thread's stack, taken while it is stuck.  That shows
+where it is stuck, which the histogram can't.
+
+Each beat costs one bisect and a couple of additions.  The background
+thread sleeps in select() until a beat would be overdue, so it wakes about
+once per THRESHOLD while beats keep coming.  The stages pause() the
+watchdog whenever no job is running, which stops the timer and leaves the
+thread blocked, so an idle window doesn't wake up for it at all.
+"""
+import bisect
+import errno
+import logging
+import os
+import select
+import sys
+import threading
+import time
+import traceback
+
+try:
+    from PySide import QtCore
+except ImportError:
+    from PySide2 import QtCore  # Stage 11, on Python 3
+
+#: Heartbeat interval, in ms
+INTERVAL = 10
+
+#: Log a stall once the GUI thread has gone this many ms without a beat
+THRESHOLD = 100
+
+#: Upper bounds of the histogram buckets, in ms late
+BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, float("inf")]
+
+
+class Watchdog(object):
+    """
+    Watches the event loop of the thread it's created on.  Create it in a
+    MainWindow's __init__ (passing the window as the parent), start() it,
+    and stop() it in closeEvent.
+    """
+    def __init__(self, parent=None, interval=INTERVAL, threshold=THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.thread_id = threading.current_thread().ident
+        self.timer = QtCore.QTimer(parent)
+        self.timer.timeout.connect(self.beat)
+        self.counts = [0] * len(BUCKETS)
+        self.beats = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.last_beat = None
+        self.reported_beat = None
+        self.active = False
+        self.stopped = False
+        self.wakeup = None  # Pipe that wakes the watcher up when active or stopped change
+        self.watcher = None
+
+    def start(self, paused=False):
+        self.stopped = False
+        self.wakeup = os.pipe()
+        self.watcher = threading.Thread(target=self.watch, name="watchdog")
+        self.watcher.daemon = True
+        self.watcher.start()
+        if not paused:
+            self.resume()
+
+    def stop(self):
+        self.pause()
+        self.stopped = True
+        if self.watcher is not None:
+            self.wake()
+            self.watcher.join()
+            self.watcher = None
+            for fd in self.wakeup:
+                os.close(fd)
+            self.wakeup = None
+
+    def resume(self):
+        """
+        Start beating and watching, if paused.  Cheap to call when not.
+        """
+        if self.active:
+            return
+        self.last_beat = time.time()
+        self.timer.start(self.interval)
+        self.active = True
+        self.wake()
+
+    def pause(self):
+        """
+        Stop beating and watching until resume(), e.g. while there's
+        nothing running that could stall the event loop.
+        """
+        if not self.active:
+            return
+        self.timer.stop()
+        self.active = False
+        self.wake()
+
+    def wake(self):
+        if self.wakeup is not None:
+            os.write(self.wakeup[1], b"!")
+
+    def beat(self):
+        now = time.time()
+        late = max(0.0, (now - self.last_beat) * 1000.0 - self.interval)
+        self.last_beat = now
+        self.counts[bisect.bisect_left(BUCKETS, late)] += 1
+        self.beats += 1
+        self.total += late
+        if late > self.maximum:
+            self.maximum = late
+        if late >= self.threshold:
+            logging.warning("Event loop stalled for %.0f ms", late + self.interval)
+
+    def watch(self):
+        """
+        Runs on the background thread, sampling the GUI thread's stack when
+        the beats stop.  It blocks until the last beat would be THRESHOLD
+        old, or for good while paused.  Each stall is only reported once.
+        """
+        timeout = None
+        while True:
+            try:
+                if select.select([self.wakeup[0]], [], [], timeout)[0]:
+                    os.read(self.wakeup[0], 4096)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            if self.stopped:
+                return
+            if not self.active:
+                timeout = None
+                continue
+            last_beat = self.last_beat
+            timeout = last_beat + self.threshold / 1000.0 - time.time()
+            if timeout > 0:
+                continue  # Not overdue yet
+            timeout = self.threshold / 1000.0  # Look again in case it's still stuck
+            if last_beat == self.reported_beat:
+                continue
+            self.reported_beat = last_beat
+            frame = sys._current_frames().get(self.thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            logging.warning("Event loop has been stalled for %d ms, GUI thread is at:\n%s",
+                            self.threshold, stack)
+
+    def histogram(self):
+        """
+        Return [(bucket upper bound in ms, number of beats), ...].
+        """
+        return zip(BUCKETS, self.counts)
+
+    def percentile(self, fraction):
+        """
+        Return the upper bound of the bucket holding the given fraction of
+        beats, e.g. 0.99 for the 99th percentile.
+        """
+        target = fraction * self.beats
+        seen = 0
+        for bound, count in self.histogram():
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.maximum) if bound == BUCKETS[-1] else bound
+        return 0.0
+
+    def summary(self):
+        return {
+            "beats": self.beats,
+            "mean": self.total / self.beats if self.beats else 0.0,
+            "p99": self.percentile(0.99),
+            "max": self.maximum,
+        }
+
+    def report(self):
+        """
+        Return the histogram and summary as text, for logging.
+        """
+        lines = ["Event loop latency over {0} beats: mean {1:.2f} ms, max {2:.1f} ms".format(
+            self.beats, self.summary()["mean"], self.maximum)]
+        previous = 0
+        for bound, count in self.histogram():
+            if count:
+                lines.append("  {0:>6} - {1:<6} ms  {2}".format(previous, bound, count))
+            previous = bound
+        return "\n".join(lines)
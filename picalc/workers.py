@@ -0,0 +1,27 @@
+"""
+Helpers for the queue-fed workers in the threading and multiprocessing
+stages.
+
+Workers block on their in_queue instead of polling it, so an idle worker
+uses no CPU.  To shut them down, exit_flag is set and one WAKEUP sentinel
+is queued per worker; whichever worker gets a sentinel looks at exit_flag
+and leaves its loop.
+"""
+import time
+
+#: Put on a worker's in_queue to wake it up without giving it a job
+WAKEUP = None
+
+
+def shutdown(exit_flag, in_queue, workers):
+    """
+    Stop and join every worker (threads or processes) reading in_queue.
+    Returns how many seconds it took.
+    """
+    started = time.time()
+    exit_flag.set()
+    for worker in workers:
+        in_queue.put(WAKEUP)
+    for worker in workers:
+        worker.join()
+    return time.time() - started
@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import checkpoints, kernel
+
+BLOCK = kernel.BLOCK_SIZE
+
+
+class MarkTest(unittest.TestCase):
+    def test_marks_are_powers_of_two_blocks(self):
+        marks = [i for i in range(0, 20 * BLOCK + 1, BLOCK) if checkpoints.is_mark(i)]
+        self.assertEqual(marks, [BLOCK, 2 * BLOCK, 4 * BLOCK, 8 * BLOCK, 16 * BLOCK])
+        self.assertFalse(checkpoints.is_mark(BLOCK + 1))
+
+    def test_next_mark(self):
+        self.assertEqual(checkpoints.next_mark(0), BLOCK)
+        self.assertEqual(checkpoints.next_mark(BLOCK), 2 * BLOCK)
+        self.assertEqual(checkpoints.next_mark(5 * BLOCK + 7), 8 * BLOCK)
+
+
+class ResumeTest(unittest.TestCase):
+    def test_resume_from_a_mark_is_the_same_as_fresh(self):
+        cache = checkpoints.CheckpointCache()
+        cache.gregory_leibniz(4 * BLOCK)
+        self.assertEqual(cache.lookup(13 * BLOCK + 5)[0], 4 * BLOCK)
+        iterations = 13 * BLOCK + 5
+        self.assertEqual(cache.gregory_leibniz(iterations), kernel.gregory_leibniz(iterations))
+
+    def test_resume_from_the_end_of_a_run(self):
+        cache = checkpoints.CheckpointCache()
+        cache.gregory_leibniz(3 * BLOCK + 11)
+        self.assertEqual(cache.lookup(6 * BLOCK)[0], 3 * BLOCK + 11)
+        self.assertAlmostEqual(cache.gregory_leibniz(6 * BLOCK), kernel.gregory_leibniz(6 * BLOCK),
+                               places=15)
+
+    def test_same_run_again_is_a_hit(self):
+        cache = checkpoints.CheckpointCache()
+        pi = cache.gregory_leibniz(5 * BLOCK)
+        hits = cache.hits
+        self.assertEqual(cache.gregory_leibniz(5 * BLOCK), pi)
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_extend_keeps_marks_and_the_last_stop(self):
+        cache = checkpoints.CheckpointCache()
+        stop = 9 * BLOCK + 3
+        total, compensation = 0.0, 0.0
+        ranges = kernel.split_range(stop, 3)
+        for lo, hi in ranges:
+            total, compensation = cache.extend(lo, hi, kernel.block_sums(hi, lo), total, compensation,
+                                               hi == stop)
+        self.assertEqual(sorted(cache.entries), [BLOCK, 2 * BLOCK, 4 * BLOCK, 8 * BLOCK, stop])
+        self.assertEqual(total + compensation, kernel.gregory_leibniz(stop))
+
+
+class EvictionTest(unittest.TestCase):
+    def test_least_recently_used_goes_first(self):
+        cache = checkpoints.CheckpointCache(memory=3 * checkpoints.ENTRY_BYTES)
+        for i in (1, 2, 3):
+            cache.store(i * BLOCK, float(i), 0.0)
+        cache.lookup(BLOCK)  # Now 2 * BLOCK is the least recently used
+        cache.store(4 * BLOCK, 4.0, 0.0)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(sorted(cache.entries), [BLOCK, 3 * BLOCK, 4 * BLOCK])
+
+    def test_storing_again_refreshes(self):
+        cache = checkpoints.CheckpointCache(memory=2 * checkpoints.ENTRY_BYTES)
+        cache.store(BLOCK, 1.0, 0.0)
+        cache.store(2 * BLOCK, 2.0, 0.0)
+        cache.store(BLOCK, 1.0, 0.0)
+        cache.store(3 * BLOCK, 3.0, 0.0)
+        self.assertEqual(sorted(cache.entries), [BLOCK, 3 * BLOCK])
+
+    def test_miss(self):
+        cache = checkpoints.CheckpointCache()
+        self.assertEqual(cache.lookup(BLOCK), (0, 0.0, 0.0))
+        self.assertEqual(cache.misses, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
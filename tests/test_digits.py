@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import digits, kernel
+
+#: pi to 1000 decimal places
+PI_1000 = (
+    "3.14159265358979323846264338327950288419716939937510582097494459230781"
+    "6406286208998628034825342117067982148086513282306647093844609550582231"
+    "7253594081284811174502841027019385211055596446229489549303819644288109"
+    "7566593344612847564823378678316527120190914564856692346034861045432664"
+    "8213393607260249141273724587006606315588174881520920962829254091715364"
+    "3678925903600113305305488204665213841469519415116094330572703657595919"
+    "5309218611738193261179310511854807446237996274956735188575272489122793"
+    "8183011949129833673362440656643086021394946395224737190702179860943702"
+    "7705392171762931767523846748184676694051320005681271452635608277857713"
+    "4275778960917363717872146844090122495343014654958537105079227968925892"
+    "3542019956112129021960864034418159813629774771309960518707211349999998"
+    "3729780499510597317328160963185950244594553469083026425223082533446850"
+    "3526193118817101000313783875288658753320838142061717766914730359825349"
+    "0428755468731159562863882353787593751957781857780532171226806613001927"
+    "8766111959092164201989")
+
+
+class Countdown(object):
+    """
+    A cancel token that gets set after ``checks`` looks at it.
+    """
+    def __init__(self, checks):
+        self.checks = checks
+
+    def is_set(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+class PiDigitsTest(unittest.TestCase):
+    def test_first_1000_digits(self):
+        self.assertEqual("".join(digits.pi_digits(1000)), PI_1000)
+
+    def test_any_number_of_parts(self):
+        for parts in (2, 3, 7, 16):
+            self.assertEqual("".join(digits.pi_digits(1000, parts)), PI_1000)
+
+    def test_fewer_digits(self):
+        for count in (1, 10, 99):
+            self.assertEqual("".join(digits.pi_digits(count, 4)), PI_1000[:count + 2])
+
+    def test_chunks(self):
+        bits = int(1000 * digits._BITS_PER_DIGIT) + digits.GUARD_BITS
+        p, q, t = digits.combine_all([digits.split(0, digits.terms_needed(1000))])
+        chunks = list(digits.decimal_chunks(digits.fixed_point(q, t, bits), bits, 1000, 300))
+        self.assertEqual([len(text) for text in chunks], [302, 300, 300, 100])
+        self.assertEqual("".join(chunks), PI_1000)
+
+    def test_progress(self):
+        reports = []
+        list(digits.pi_digits(1000, 4, lambda i, terms: reports.append((i, terms))))
+        terms = digits.terms_needed(1000)
+        self.assertEqual(len(reports), 4)
+        self.assertEqual(reports[-1], (terms, terms))
+
+
+class CancelTest(unittest.TestCase):
+    def test_cancelled_between_ranges(self):
+        try:
+            list(digits.pi_digits(1000, 8, cancel=Countdown(3)))
+        except kernel.Cancelled as e:
+            self.assertGreater(e.i, 0)
+            self.assertLess(e.i, digits.terms_needed(1000))
+        else:
+            self.fail("not cancelled")
+
+    def test_cancelled_while_combining(self):
+        # 8 checks between ranges, then the combines
+        try:
+            list(digits.pi_digits(1000, 8, cancel=Countdown(10)))
+        except kernel.Cancelled as e:
+            self.assertEqual(e.i, 0)
+        else:
+            self.fail("not cancelled")
+
+    def test_combine_all_checks_cancel(self):
+        results = [digits.split(a, a + 2) for a in range(0, 16, 2)]
+        self.assertRaises(kernel.Cancelled, digits.combine_all, results, Countdown(5))
+        self.assertEqual(digits.combine_all(results, Countdown(7)), digits.combine_all(results))
+
+
+if __name__ == "__main__":
+    unittest.main()
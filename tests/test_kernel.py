@@ -0,0 +1,80 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import kernel
+
+
+def term(k):
+    return (4.0 if k % 2 == 0 else -4.0) / (2 * k + 1)
+
+
+def split_sum(stop, parts, start=0, block_size=kernel.BLOCK_SIZE):
+    sums = []
+    for lo, hi in kernel.split_range(stop, parts, start, block_size):
+        sums.extend(kernel.block_sums(hi, lo, block_size))
+    return kernel.reduce_block_sums(sums)
+
+
+class BlockSumTest(unittest.TestCase):
+    def test_matches_the_terms(self):
+        for lo, hi in [(0, 8), (3, 8), (5, 6), (8, 16), (9, 13)]:
+            expected = math.fsum(term(k) for k in range(lo, hi))
+            self.assertAlmostEqual(kernel.block_sum(lo, hi, 8), expected, places=15)
+
+    def test_odd_block_size(self):
+        self.assertRaises(ValueError, list, kernel.block_bounds(10, 0, 7))
+
+
+class SplitRangeTest(unittest.TestCase):
+    def check_cover(self, stop, parts, start, block_size):
+        ranges = kernel.split_range(stop, parts, start, block_size)
+        self.assertLessEqual(len(ranges), parts)
+        self.assertEqual(ranges[0][0], start)
+        self.assertEqual(ranges[-1][1], stop)
+        for (lo, hi), (next_lo, next_hi) in zip(ranges, ranges[1:]):
+            self.assertEqual(hi, next_lo)
+            self.assertEqual(hi % block_size, 0)  # On the block grid
+        for lo, hi in ranges:
+            self.assertLess(lo, hi)
+
+    def test_covers_the_range_on_the_grid(self):
+        for stop in (1, 7, 8, 9, 100, 1001):
+            for parts in range(1, 10):
+                for start in (0, 1, 3, 8):
+                    if start < stop:
+                        self.check_cover(stop, parts, start, 8)
+
+    def test_no_more_parts_than_blocks(self):
+        self.assertEqual(len(kernel.split_range(20, 10, 0, 8)), 3)
+
+
+class DeterminismTest(unittest.TestCase):
+    def test_same_pi_for_any_number_of_parts(self):
+        for stop in (1000000, 1234567):
+            whole = split_sum(stop, 1)
+            for parts in range(2, 17):
+                self.assertEqual(split_sum(stop, parts), whole)
+
+    def test_odd_start(self):
+        for start in (1, 3, 12345):
+            stop = 345679
+            whole = split_sum(stop, 1, start, 256)
+            for parts in range(2, 9):
+                self.assertEqual(split_sum(stop, parts, start, 256), whole)
+            expected = math.fsum(term(k) for k in range(start, stop))
+            self.assertAlmostEqual(whole, expected, places=13)
+
+    def test_order_of_the_sums_doesnt_matter(self):
+        sums = kernel.block_sums(1000000)
+        self.assertEqual(kernel.reduce_block_sums(sums), kernel.reduce_block_sums(sums[::-1]))
+
+    def test_pieces_add_up_to_the_running_sum(self):
+        stop = 1000003
+        self.assertAlmostEqual(split_sum(stop, 5), kernel.gregory_leibniz(stop), places=14)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import protocol
+
+
+class Doorbell(object):
+    def __init__(self):
+        self.rings = 0
+
+    def ring(self):
+        self.rings += 1
+
+
+def records(out_queue):
+    return [record for batch in drain(out_queue) for record in protocol.unpack(batch)]
+
+
+def drain(out_queue):
+    batches = []
+    while not out_queue.empty():
+        batches.append(out_queue.get_nowait())
+    return batches
+
+
+class PackTest(unittest.TestCase):
+    def test_round_trip(self):
+        batch = b"".join([
+            protocol.pack(protocol.PROGRESS, 7, 1000, 1500, 3.25, 1e-3),
+            protocol.pack(protocol.DONE, 7, 1000, 2000, 0.5, payload=[1.5, -0.25, 1e-300]),
+            protocol.pack(protocol.CANCELLED, 8),
+            protocol.pack(protocol.DIGITS, 9, i=4, payload=b"3141"),
+        ])
+        self.assertEqual(list(protocol.unpack(batch)), [
+            protocol.Record(protocol.PROGRESS, 7, 1000, 1500, 3.25, 1e-3, []),
+            protocol.Record(protocol.DONE, 7, 1000, 2000, 0.5, None, [1.5, -0.25, 1e-300]),
+            protocol.Record(protocol.CANCELLED, 8, 0, 0, 0.0, None, []),
+            protocol.Record(protocol.DIGITS, 9, 0, 4, 0.0, None, b"3141"),
+        ])
+
+    def test_sizes(self):
+        self.assertEqual(len(protocol.pack(protocol.PROGRESS, 1)), protocol.HEADER.size)
+        self.assertEqual(len(protocol.pack(protocol.DONE, 1, payload=[0.0] * 3)),
+                         protocol.HEADER.size + 24)
+
+    def test_empty_batch(self):
+        self.assertEqual(list(protocol.unpack(b"")), [])
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self):
+        self.out_queue = protocol.Queue.Queue(protocol.QUEUE_SIZE)
+        self.doorbell = Doorbell()
+
+    def test_keeps_the_newest_progress(self):
+        writer = protocol.Writer(self.out_queue, self.doorbell)
+        for i in range(1, 6):
+            writer.add(protocol.PROGRESS, 1, 0, i, float(i))
+            writer.add(protocol.PROGRESS, 1, 100, 100 + i, float(i))
+            writer.add(protocol.PROGRESS, 2, 0, 10 * i, float(i))
+        writer.flush()
+        self.assertEqual(self.doorbell.rings, 1)
+        self.assertEqual([(r.job_id, r.start, r.i) for r in records(self.out_queue)],
+                         [(1, 0, 5), (1, 100, 105), (2, 0, 50)])
+
+    def test_done_replaces_its_progress(self):
+        writer = protocol.Writer(self.out_queue, self.doorbell)
+        writer.add(protocol.PROGRESS, 1, 0, 5, 3.0)
+        writer.add(protocol.PROGRESS, 1, 100, 105, 3.0)
+        writer.add(protocol.DONE, 1, 0, 100, 3.1)
+        writer.flush()
+        self.assertEqual([(r.kind, r.start) for r in records(self.out_queue)],
+                         [(protocol.PROGRESS, 100), (protocol.DONE, 0)])
+
+    def test_flush_due_waits_for_the_interval(self):
+        writer = protocol.Writer(self.out_queue, self.doorbell, interval=60)
+        writer.add(protocol.PROGRESS, 1, 0, 5, 3.0)
+        writer.flush_due()
+        writer.add(protocol.PROGRESS, 1, 0, 6, 3.0)
+        writer.flush_due()
+        self.assertEqual(self.doorbell.rings, 1)
+        writer.flush()
+        self.assertEqual([r.i for r in records(self.out_queue)], [5, 6])
+
+    def test_nothing_to_send(self):
+        protocol.Writer(self.out_queue, self.doorbell).flush()
+        self.assertEqual(self.doorbell.rings, 0)
+        self.assertTrue(self.out_queue.empty())
+
+
+class OverflowTest(unittest.TestCase):
+    def setUp(self):
+        self.out_queue = protocol.Queue.Queue(1)
+        self.out_queue.put(b"")
+        self.doorbell = Doorbell()
+
+    def make_room_soon(self):
+        def get():
+            time.sleep(0.05)
+            self.out_queue.get()
+        thread = threading.Thread(target=get)
+        thread.start()
+        return thread
+
+    def test_drop_progress_when_full(self):
+        writer = protocol.Writer(self.out_queue, self.doorbell, protocol.DROP_PROGRESS)
+        writer.add(protocol.PROGRESS, 1, 0, 5, 3.0)
+        writer.flush()
+        self.assertEqual(self.doorbell.rings, 0)
+        self.assertEqual(drain(self.out_queue), [b""])
+
+    def test_drop_progress_keeps_the_rest(self):
+        writer = protocol.Writer(self.out_queue, self.doorbell, protocol.DROP_PROGRESS)
+        writer.add(protocol.PROGRESS, 1, 100, 105, 3.0)
+        writer.add(protocol.DONE, 1, 0, 100, 3.1)
+        thread = self.make_room_soon()
+        writer.flush()
+        thread.join()
+        self.assertEqual(self.doorbell.rings, 1)
+        self.assertEqual([r.kind for r in records(self.out_queue)], [protocol.DONE])
+
+    def test_block_keeps_everything(self):
+        writer = protocol.Writer(self.out_queue, self.doorbell, protocol.BLOCK)
+        writer.add(protocol.PROGRESS, 1, 100, 105, 3.0)
+        writer.add(protocol.DONE, 1, 0, 100, 3.1)
+        thread = self.make_room_soon()
+        writer.flush()
+        thread.join()
+        self.assertEqual(self.doorbell.rings, 1)
+        self.assertEqual([r.kind for r in records(self.out_queue)],
+                         [protocol.PROGRESS, protocol.DONE])
+
+    def test_block_gives_up_on_exit(self):
+        exit_flag = threading.Event()
+        exit_flag.set()
+        writer = protocol.Writer(self.out_queue, self.doorbell, protocol.BLOCK, exit_flag)
+        writer.add(protocol.PROGRESS, 1, 0, 5, 3.0)
+        writer.flush()
+        self.assertEqual(self.doorbell.rings, 0)
+        self.assertEqual(drain(self.out_queue), [b""])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import scheduler
+
+
+class PriorityTest(unittest.TestCase):
+    def test_urgent_goes_first(self):
+        jobs = scheduler.Scheduler(10)
+        jobs.submit(1, scheduler.NORMAL, ["a"])
+        jobs.submit(2, scheduler.URGENT, ["b"])
+        jobs.submit(3, scheduler.NORMAL, ["c"])
+        jobs.submit(4, scheduler.URGENT, ["d"])
+        self.assertEqual(jobs.ready(), ["b", "d", "a", "c"])
+
+    def test_first_in_first_out_within_a_priority(self):
+        jobs = scheduler.Scheduler(10)
+        jobs.submit(1, scheduler.NORMAL, ["1a", "1b"])
+        jobs.submit(2, scheduler.NORMAL, ["2a"])
+        jobs.submit(3, scheduler.NORMAL, ["3a", "3b"])
+        self.assertEqual(jobs.ready(), ["1a", "1b", "2a", "3a", "3b"])
+
+    def test_urgent_job_overtakes_waiting_tasks(self):
+        jobs = scheduler.Scheduler(1)
+        jobs.submit(1, scheduler.NORMAL, ["1a", "1b"])
+        self.assertEqual(jobs.ready(), ["1a"])
+        jobs.submit(2, scheduler.URGENT, ["2a"])
+        jobs.task_done()
+        self.assertEqual(jobs.ready(), ["2a"])
+        jobs.task_done()
+        self.assertEqual(jobs.ready(), ["1b"])
+
+
+class ConcurrencyTest(unittest.TestCase):
+    def test_at_most_concurrency_out(self):
+        jobs = scheduler.Scheduler(2)
+        jobs.submit(1, scheduler.NORMAL, ["a", "b", "c", "d"])
+        self.assertEqual(jobs.ready(), ["a", "b"])
+        self.assertEqual(jobs.ready(), [])
+        self.assertEqual(len(jobs), 2)
+
+    def test_task_done_makes_room(self):
+        jobs = scheduler.Scheduler(2)
+        jobs.submit(1, scheduler.NORMAL, ["a", "b", "c", "d"])
+        jobs.ready()
+        jobs.task_done()
+        self.assertEqual(jobs.ready(), ["c"])
+        jobs.task_done()
+        jobs.task_done()
+        self.assertEqual(jobs.ready(), ["d"])
+        self.assertEqual(len(jobs), 0)
+
+    def test_cut_keeps_the_rest_in_line(self):
+        def cut(task):
+            lo, hi = task
+            if hi - lo <= 10:
+                return task, None
+            return (lo, lo + 10), (lo + 10, hi)
+
+        jobs = scheduler.Scheduler(2)
+        jobs.submit(1, scheduler.NORMAL, [(0, 25)])
+        jobs.submit(2, scheduler.NORMAL, [(0, 5)])
+        self.assertEqual(jobs.ready(cut), [(0, 10), (10, 20)])
+        jobs.task_done()
+        jobs.task_done()
+        self.assertEqual(jobs.ready(cut), [(20, 25), (0, 5)])
+
+
+class CancelTest(unittest.TestCase):
+    def test_only_pending_tasks_are_returned(self):
+        jobs = scheduler.Scheduler(2)
+        jobs.submit(1, scheduler.NORMAL, ["1a", "1b", "1c"])
+        jobs.submit(2, scheduler.NORMAL, ["2a"])
+        jobs.submit(3, scheduler.NORMAL, ["3a"])
+        self.assertEqual(jobs.ready(), ["1a", "1b"])
+        self.assertEqual(sorted(jobs.cancel(2)), [(1, "1c"), (2, "2a")])
+        self.assertEqual(len(jobs), 1)
+        jobs.task_done()
+        self.assertEqual(jobs.ready(), ["3a"])
+
+    def test_nothing_to_cancel(self):
+        jobs = scheduler.Scheduler(1)
+        jobs.submit(5, scheduler.NORMAL, ["5a"])
+        self.assertEqual(jobs.cancel(4), [])
+        self.assertEqual(jobs.ready(), ["5a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
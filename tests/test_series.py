@@ -0,0 +1,83 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import series
+
+
+def powers_of_two():
+    n = 2
+    while n <= series.MAX_ACCELERATED:
+        yield n
+        n *= 2
+
+
+class ToleranceForTest(unittest.TestCase):
+    def test_half_a_unit_in_the_last_place(self):
+        self.assertAlmostEqual(series.tolerance_for(1), 0.05)
+        self.assertAlmostEqual(series.tolerance_for(8), 5e-9)
+
+    def test_rounds_to_the_places(self):
+        for places in range(1, 16):
+            tolerance = series.tolerance_for(places)
+            self.assertLessEqual(abs(round(math.pi, places) - math.pi), tolerance)
+
+    def test_too_many_places_is_zero(self):
+        self.assertEqual(series.tolerance_for(400), 0.0)
+
+
+class TermsForTest(unittest.TestCase):
+    def test_plain_is_the_fewest_terms(self):
+        for tolerance in (0.1, 1e-3, 1e-6, 4e-9):
+            n = series.terms_for(series.PLAIN, tolerance)
+            self.assertLessEqual(series.error_bound(n), tolerance)
+            self.assertGreater(series.error_bound(n - 1), tolerance)
+
+    def test_pairs_are_whole(self):
+        for tolerance in (0.1, 1e-3, 1e-6, 4e-9):
+            n = series.terms_for(series.PAIRS, tolerance)
+            self.assertEqual(n % 2, 0)
+            self.assertLessEqual(series.error_bound(n), tolerance)
+
+    def test_plain_and_pairs_are_capped(self):
+        for mode in (series.PLAIN, series.PAIRS):
+            for tolerance in (1e-12, 1e-16, 5e-324, 0.0):
+                self.assertEqual(series.terms_for(mode, tolerance), series.MAX_TERMS)
+
+    def test_accelerated_reaches_a_reachable_target(self):
+        for mode in (series.EULER, series.RICHARDSON):
+            for tolerance in (1e-3, 1e-8, 1e-12):
+                n = series.terms_for(mode, tolerance)
+                self.assertLessEqual(series.accelerated(mode, n)[1], tolerance)
+                self.assertGreater(series.accelerated(mode, n // 2)[1], tolerance)
+
+    def test_accelerated_falls_back_to_the_best_estimate(self):
+        for mode in (series.EULER, series.RICHARDSON):
+            best = min(series.accelerated(mode, n)[1] for n in powers_of_two())
+            for tolerance in (1e-16, 5e-324, 0.0):
+                n = series.terms_for(mode, tolerance)
+                self.assertLessEqual(n, series.MAX_ACCELERATED)
+                self.assertEqual(series.accelerated(mode, n)[1], best)
+
+    def test_bad_tolerances(self):
+        for mode in series.MODES:
+            self.assertRaises(ValueError, series.terms_for, mode, -1e-6)
+            self.assertRaises(ValueError, series.terms_for, mode, float("nan"))
+
+
+class StepsTest(unittest.TestCase):
+    def test_last_step_is_what_evaluate_gives(self):
+        for mode in series.MODES:
+            for iterations in (0, 1, 2, 3, 100001):
+                i, pi, error = list(series.steps(mode, iterations))[-1]
+                self.assertEqual((pi, error), series.evaluate(mode, iterations))
+
+    def test_nothing_to_sum(self):
+        self.assertEqual(list(series.steps(series.PLAIN, 0)), [(0, 0.0, 4.0)])
+        self.assertEqual(list(series.steps(series.PAIRS, 1)), [(0, 0.0, 4.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
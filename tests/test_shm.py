@@ -0,0 +1,31 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from picalc import shm
+
+
+class ProgressBoardTest(unittest.TestCase):
+    def test_unposted_slot(self):
+        board = shm.ProgressBoard(2)
+        self.assertEqual(board.read(1), (-1, 0, 0, 0.0))
+
+    def test_read_what_was_posted(self):
+        board = shm.ProgressBoard(2)
+        board.post(1, 7, 1000, 1500, 3.25)
+        self.assertEqual(board.read(1), (7, 1000, 1500, 3.25))
+        self.assertEqual(board.read(0), (-1, 0, 0, 0.0))
+
+    def test_half_written_slot_gives_the_last_read(self):
+        board = shm.ProgressBoard(1)
+        board.post(0, 7, 0, 10, 3.0)
+        board.read(0)
+        # A worker that died in the middle of a post leaves the sequence odd
+        board.slots[0].sequence += 1
+        board.slots[0].i = 20
+        self.assertEqual(board.read(0), (7, 0, 10, 3.0))
+
+
+if __name__ == "__main__":
+    unittest.main()